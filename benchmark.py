@@ -0,0 +1,232 @@
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import contextlib
+import numpy as np
+from src.payoff_matrix import PayoffMatrix
+from src.psne import IESDS, best_responses
+from src.create_game import create_game, save_game
+
+
+# square game sizes (strategies per player) of the ladder, from the sweep games up to large games
+DEFAULT_SIZES = [10, 50, 200, 500, 1000, 2000]
+QUICK_SIZES = [10, 50, 200]
+# solving one strategy elimination at a time costs a dominance check per elimination, so it is only timed up to here
+SEQUENTIAL_IESDS_MAX_SIZE = 200
+DEFAULT_OUTPUT = "bench_output.json"
+
+def time_call(stmt, setup=None, repeat=5, min_time=0.2, max_time=10.0, max_repeat=1000):
+    """
+    Times a function call.
+
+    The call is repeated at least `repeat` times and until `min_time` seconds
+    have been spent in it, but slow calls are not repeated once `max_time`
+    seconds have been spent. If a setup function is given, it is called untimed
+    before every call and its result is passed to stmt.
+
+    Args:
+        stmt (callable): Function to time.
+        setup (callable, optional): Function creating the argument of stmt, e.g. a fresh game.
+        repeat (int): Minimum number of timed calls.
+        min_time (float): Minimum total time of the timed calls in seconds.
+        max_time (float): Time in seconds after which no further call is started.
+        max_repeat (int): Maximum number of timed calls.
+
+    Returns:
+        dict: Best and median time per call in seconds and the number of calls.
+    """
+    times = []
+    while not times or (len(times) < max_repeat and sum(times) < max_time
+                        and (len(times) < repeat or sum(times) < min_time)):
+        if setup is not None:
+            argument = setup()
+            start = time.perf_counter()
+            stmt(argument)
+        else:
+            start = time.perf_counter()
+            stmt()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times), "calls": len(times)}
+
+def random_bimatrix(size, seed=0):
+    """
+    Returns a random general bimatrix game with integer payoffs from -100 to 100.
+    """
+    rng = np.random.default_rng(seed)
+    return PayoffMatrix(payoffs=rng.integers(-100, 101, size=(size, size, 2)))
+
+def game_benchmarks(size, work_dir):
+    """
+    Yields (name, stmt, setup) benchmarks for one size of the ladder.
+
+    The tie-sharing game of a size has R = size and M_A = M_B = size - 1, so
+    odd sizes have half-unit payoffs.
+
+    Args:
+        size (int): Number of strategies per player.
+        work_dir (str): Directory for the game files loaded by the benchmarks.
+    """
+    R, M = size, size - 1
+    game = create_game(R, M, M)
+    float_payoffs = game.actual_payoffs().astype(float)
+    game_path = os.path.join(work_dir, f"game_{size}.csv")
+    save_game(float_payoffs, game_path)
+    middle = game.p1_strategies[size // 2]
+
+    yield "create_game", lambda: create_game(R, M, M), None
+    yield "load_csv", lambda: PayoffMatrix(file_source=game_path), None
+    yield "load_array", lambda: PayoffMatrix(payoffs=float_payoffs), None
+    yield "dominated_strategies", lambda: game.dominated_strategies(player=1), None
+    yield "eliminate_strategy", lambda g: g.eliminate_strategy(player=1, strategy=middle), \
+        lambda: PayoffMatrix(payoffs=game.payoffs, scale=game.scale)
+    yield "iesds_batched", lambda g: IESDS(g, show_steps=False, batched=True), \
+        lambda: PayoffMatrix(payoffs=game.payoffs, scale=game.scale)
+    if size <= SEQUENTIAL_IESDS_MAX_SIZE:
+        yield "iesds_sequential", lambda g: IESDS(g, show_steps=False), \
+            lambda: PayoffMatrix(payoffs=game.payoffs, scale=game.scale)
+    yield "best_responses", lambda: best_responses(game, show_steps=False), None
+
+    random_game = random_bimatrix(size)
+    yield "random_iesds_batched", lambda g: IESDS(g, show_steps=False, batched=True), \
+        lambda: PayoffMatrix(payoffs=random_game.payoffs)
+    yield "random_best_responses", lambda: best_responses(random_game, show_steps=False), None
+
+def sweep_benchmarks():
+    """
+    Yields (name, stmt, setup) benchmarks of the full simulate_games_with_nash_predictions
+    sweep, one per solver. The sweep runs in a temporary directory and its output is discarded.
+    The memo of the canonical solver is cleared before every call, so every call solves the games.
+    """
+    from main import simulate_games_with_nash_predictions
+    from src.canonical import _solve_canonical
+
+    def run_sweep(solver):
+        with tempfile.TemporaryDirectory() as sweep_dir:
+            cwd = os.getcwd()
+            os.chdir(sweep_dir)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    simulate_games_with_nash_predictions(solver=solver)
+            finally:
+                os.chdir(cwd)
+
+    for solver in ["iesds", "batch", "canonical"]:
+        yield f"sweep_{solver}", lambda _, solver=solver: run_sweep(solver), _solve_canonical.cache_clear
+
+def run_benchmarks(sizes=DEFAULT_SIZES, sweep=True, repeat=5, min_time=0.2, max_time=10.0, pattern=None):
+    """
+    Runs the benchmark suite and prints one line per benchmark.
+
+    Args:
+        sizes (list): Game sizes of the ladder.
+        sweep (bool): Whether to time the full sweep.
+        repeat (int): Minimum number of timed calls per benchmark.
+        min_time (float): Minimum time spent per benchmark in seconds.
+        max_time (float): Time per benchmark after which slow calls are not repeated.
+        pattern (str, optional): Only run benchmarks whose name contains this string.
+
+    Returns:
+        dict: Machine-readable results with the environment under "meta" and one entry
+        per benchmark under "results", keyed "name[size]" or "name".
+    """
+    results = {}
+
+    def run(key, stmt, setup, size=None):
+        if pattern is not None and pattern not in key:
+            return
+        timing = time_call(stmt, setup, repeat, min_time, max_time)
+        results[key] = dict(timing, size=size)
+        print(f"{key:<36} best {timing['best'] * 1e3:12.3f} ms   median {timing['median'] * 1e3:12.3f} ms"
+              f"   ({timing['calls']} calls)", flush=True)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            for name, stmt, setup in game_benchmarks(size, work_dir):
+                run(f"{name}[{size}]", stmt, setup, size)
+    if sweep:
+        for name, stmt, setup in sweep_benchmarks():
+            run(name, stmt, setup)
+
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
+
+def compare_results(current, baseline, threshold=0.1):
+    """
+    Compares benchmark results with a stored baseline and prints the ratio of the best times.
+
+    Args:
+        current (dict): Results of run_benchmarks.
+        baseline (dict): Stored results of an earlier run.
+        threshold (float): Relative slowdown of the best time above which a benchmark is a regression.
+
+    Baseline benchmarks that were not run are listed as missing, they are not regressions.
+
+    Returns:
+        list: Names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for key, timing in current["results"].items():
+        if key not in baseline["results"]:
+            print(f"{key:<36} {'-':>12} {timing['best'] * 1e3:12.3f}    new")
+            continue
+        baseline_best = baseline["results"][key]["best"]
+        ratio = timing["best"] / baseline_best
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<36} {baseline_best * 1e3:12.3f} {timing['best'] * 1e3:12.3f} {ratio:7.2f}{flag}")
+    missing = [key for key in baseline["results"] if key not in current["results"]]
+    for key in missing:
+        print(f"{key:<36} {baseline['results'][key]['best'] * 1e3:12.3f} {'-':>12}    missing")
+    if missing:
+        print(f"\n{len(missing)} baseline benchmark(s) missing from this run: {', '.join(missing)}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {threshold:.0%}: {', '.join(regressions)}")
+    else:
+        print(f"\nNo regressions above {threshold:.0%}.")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark game generation, loading and the solvers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help=f"Game sizes of the ladder, default {DEFAULT_SIZES}.")
+    parser.add_argument("--quick", action="store_true", help=f"Only run sizes {QUICK_SIZES}.")
+    parser.add_argument("--no-sweep", action="store_true", help="Do not time the full sweep.")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this string.")
+    parser.add_argument("--repeat", type=int, default=5, help="Minimum number of timed calls per benchmark.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum time per benchmark in seconds.")
+    parser.add_argument("--max-time", type=float, default=10.0,
+                        help="Time per benchmark in seconds after which slow calls are not repeated.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file to write the results to.")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",
+                        help="Compare with the results in this JSON file, exit with status 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown flagged as a regression by --compare.")
+    args = parser.parse_args()
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    current = run_benchmarks(sizes, sweep=not args.no_sweep, repeat=args.repeat, min_time=args.min_time,
+                             max_time=args.max_time, pattern=args.filter)
+    with open(args.output, "w") as json_file:
+        json.dump(current, json_file, indent=2)
+    print(f"Benchmark results saved to {args.output}.")
+
+    if args.compare is not None:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)
+        if compare_results(current, baseline, args.threshold):
+            sys.exit(1)
@@ -1,11 +1,16 @@
 import os
 import csv
-import pandas as pd
-from src.payoff_matrix import PayoffMatrix
-from src.psne import IESDS
-from src.create_game import create_game
-from src.predict_signature import predict_signature
-from src.predict_nash import predict_pure_nash_with_locations
+import json
+import heapq
+import time
+import argparse
+from src.create_game import scaled_game_payoffs
+from src.game_store import GameStore
+from src.result_cache import ResultCache
+from src.results_writer import RESULTS_HEADER, ResultWriter, sort_csv_external
+from src.sweep import AccuracyTally, evaluate_games, game_grid, sweep
+from src import instrumentation
+from src.counterexample_search import search_counterexamples, print_counterexamples
 
 
 def print_rule_performance(performance_dict):
@@ -19,127 +24,321 @@ def print_rule_performance(performance_dict):
         total = counts["correct"] + counts["incorrect"]
         accuracy = counts["correct"] / total if total > 0 else 0
         print(f"{rule}: Correct = {counts['correct']}, Incorrect = {counts['incorrect']}, Accuracy = {accuracy:.2%}")
+
+
+def merge_rule_performance(target, source):
+    """
+    Adds the correct/incorrect counts of one performance dictionary to another.
+
+    Args:
+        target (dict): Performance dictionary that is updated in place.
+        source (dict): Performance dictionary whose counts are added.
+    """
+    for rule, counts in source.items():
+        if rule not in target:
+            target[rule] = {"correct": 0, "incorrect": 0}
+        target[rule]["correct"] += counts["correct"]
+        target[rule]["incorrect"] += counts["incorrect"]
         
 
+def sorted_csv_path(input_csv):
+    """
+    Returns the path of the sorted copy of a results CSV file, with "_sorted" appended to the filename.
+    """
+    return input_csv.replace(".csv", "_sorted.csv")
+
 def sort_csv_by_columns(input_csv):
     """
-    Sorts a CSV file by specified columns and saves the sorted file with "_sorted" appended to the filename.
+    Sorts a results CSV file by SigRuleUsed, R, M_A and M_B and saves the sorted file with "_sorted"
+    appended to the filename. The file is sorted externally, so it does not need to fit in memory.
     
     Args:
         input_csv (str): Path to the input CSV file.
     """
-    data = pd.read_csv(input_csv)
-    sorted_data = data.sort_values(by=["SigRuleUsed", "R", "M_A", "M_B"], ascending=True)
-    sorted_csv_path = input_csv.replace(".csv", "_sorted.csv")
-    sorted_data.to_csv(sorted_csv_path, index=False)
-    print(f"Sorted results saved to: {sorted_csv_path}")
+    sort_csv_external(input_csv, sorted_csv_path(input_csv))
+    print(f"Sorted results saved to: {sorted_csv_path(input_csv)}")
+
+def print_accuracy_report(rule_performance):
+    """
+    Prints the accuracy of each prediction type.
+
+    Args:
+        rule_performance (dict): Maps "signature", "nash_count" and "nash_location" to performance dictionaries.
+    """
+    print("\n=== Signature Prediction Accuracy ===")
+    print_rule_performance(rule_performance["signature"])
+
+    print("\n=== Nash Count Prediction Accuracy ===")
+    print_rule_performance(rule_performance["nash_count"])
+
+    print("\n=== Nash Location Prediction Accuracy ===")
+    print_rule_performance(rule_performance["nash_location"])
+
+def game_cost(R, M_A, M_B):
+    """
+    Estimates the relative cost of solving a game, dominated by the pairwise strategy comparisons of IESDS.
+    """
+    return (M_A + 1) * (M_B + 1) * (M_A + M_B + 2)
+
+def shard_games(grid, shard, num_shards):
+    """
+    Deterministically partitions the grid into cost-balanced shards.
+
+    Games are assigned from the most to the least expensive, each to the shard
+    with the lowest total cost so far (ties go to the lowest shard number).
+
+    Args:
+        grid (list): List of (R, M_A, M_B) tuples in grid order.
+        shard (int): Shard number, from 1 to num_shards.
+        num_shards (int): Total number of shards.
+
+    Returns:
+        list: The games of the shard, in grid order.
+    """
+    if not 1 <= shard <= num_shards:
+        raise ValueError(f"Shard {shard} is not in 1..{num_shards}")
+    loads = [(0, i) for i in range(num_shards)]
+    assigned = []
+    by_cost = sorted(range(len(grid)), key=lambda i: (-game_cost(*grid[i]), i))
+    for i in by_cost:
+        load, target = heapq.heappop(loads)
+        if target == shard - 1:
+            assigned.append(i)
+        heapq.heappush(loads, (load + game_cost(*grid[i]), target))
+    return [grid[i] for i in sorted(assigned)]
+
+def shard_paths(mode, shard, num_shards):
+    """
+    Returns the paths of the partial result CSV and rule performance JSON of a shard.
+    """
+    suffix = f"shard{shard}of{num_shards}"
+    return f"results_{mode}.{suffix}.csv", f"rule_performance_{mode}.{suffix}.json"
 
-def simulate_games_with_nash_predictions(mode="all"):
+def tally_row(rule_performance, row):
+    """
+    Adds a result CSV row to the rule performance, counting rules in order of first appearance.
+    """
+    for tracker, rule_column, correct_column in [
+        ("signature", "SigRuleUsed", "SigPredTrue?"),
+        ("nash_count", "NumRuleUsed", "NumPredTrue?"),
+        ("nash_location", "LocRuleUsed", "LocPredTrue?")
+    ]:
+        rule = row[RESULTS_HEADER.index(rule_column)]
+        counts = rule_performance[tracker].setdefault(rule, {"correct": 0, "incorrect": 0})
+        counts["correct" if row[RESULTS_HEADER.index(correct_column)] == "Yes" else "incorrect"] += 1
+
+def merge_shards(mode, num_shards):
+    """
+    Combines the partial results of all shards into results_{mode}.csv, its sorted
+    copy and the accuracy report. Only reads the shard files from the working directory.
+
+    Args:
+        mode (str): Game mode the shards were run with.
+        num_shards (int): Total number of shards.
+    """
+    results_csv = f"results_{mode}.csv"
+    csv_paths, shard_performance = [], {"signature": {}, "nash_count": {}, "nash_location": {}}
+    num_games = 0
+    for shard in range(1, num_shards + 1):
+        csv_path, json_path = shard_paths(mode, shard, num_shards)
+        with open(json_path) as json_file:
+            summary = json.load(json_file)
+        for tracker, performance in summary["rule_performance"].items():
+            merge_rule_performance(shard_performance[tracker], performance)
+        num_games += summary["games"]
+        csv_paths.append(csv_path)
+
+    # Each shard is written in grid order, so a k-way merge restores the order of an unsharded run
+    csv_files = [open(path, newline='') for path in csv_paths]
+    readers = []
+    for csv_file in csv_files:
+        reader = csv.reader(csv_file)
+        next(reader)
+        readers.append(reader)
+    rule_performance = {"signature": {}, "nash_count": {}, "nash_location": {}}
+    num_rows = 0
+    with open(results_csv, "w", newline='') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(RESULTS_HEADER)
+        for row in heapq.merge(*readers, key=lambda row: tuple(int(v) for v in row[:3])):
+            csv_writer.writerow(row)
+            tally_row(rule_performance, row)
+            num_rows += 1
+    for csv_file in csv_files:
+        csv_file.close()
+
+    if num_rows != num_games or rule_performance != shard_performance:
+        raise ValueError("Shard result files do not match their rule performance files")
+
+    print_accuracy_report(rule_performance)
+    print(f"Results saved to {results_csv}.")
+    sort_csv_by_columns(results_csv)
+
+def simulate_games_with_nash_predictions(mode="all", games_dir=None, game_store_path=None, jobs=1,
+                                         max_players=10, max_M_A=10, max_M_B=10, shard=None, solver="iesds",
+                                         cache_path=None, arrow_path=None, instrument_path=None, per_game=False):
     """
     Simulates games, evaluates Nash equilibrium predictions, and logs the results.
     
     Args:
         mode (str): Game mode, either "all", "symmetric", or "asymmetric".
+        games_dir (str, optional): Directory to persist game CSV files in, e.g. "./games".
+            By default games are only kept in memory.
+        game_store_path (str, optional): Binary game store to persist games in, e.g. "./games.store".
+            Games already in the store are reopened from it instead of being regenerated.
+        jobs (int): Number of worker processes, 0 uses all cores. The output does not depend on it.
+        max_players (int): Exclusive upper bound for R.
+        max_M_A (int): Exclusive upper bound for M_A.
+        max_M_B (int): Exclusive upper bound for M_B.
+        shard (tuple, optional): (i, n) to only run shard i of n. The shard writes partial
+            result and rule performance files that are combined by merge_shards.
+        solver (str): "iesds" to solve games one by one, "batch" to solve each chunk of games
+            at once with the batched tensor solver, "canonical" to only solve the canonical game
+            of each grid point (see src/canonical.py). All give the same results.
+        cache_path (str, optional): SQLite result cache, e.g. "./results_cache.sqlite". Games solved
+            by the current solver version are only re-scored, newly solved games are added after
+            every chunk, so an interrupted sweep resumes where it stopped.
+        arrow_path (str, optional): Also write the results with typed columns to this Arrow IPC
+            file, e.g. "./results_all.arrow". Requires pyarrow.
+        instrument_path (str, optional): Record the wall time of every stage (game creation and
+            loading, dominance checks, eliminations, best responses, predictions, writing) and
+            event counters, and save them to this JSON file. Disabled by default, at no cost.
+        per_game (bool): With instrument_path, also save the solve time and counters of every game.
     """
+    start_time = time.perf_counter()
+    if instrument_path is not None:
+        instrumentation.enable(per_game)
+
     # Directory and file paths
-    games_dir = "./games"
     logs_dir = "./logs"
     results_csv = f"results_{mode}.csv"
 
-    os.makedirs(games_dir, exist_ok=True)
+    if games_dir is not None:
+        os.makedirs(games_dir, exist_ok=True)
     os.makedirs(logs_dir, exist_ok=True)
 
-    # Parameter ranges
-    max_players, max_M_A, max_M_B = 10, 10, 10
-    player_range = range(1, max_players)
-    strategy_a_range = range(1, max_M_A)
+    jobs = jobs or os.cpu_count()
+    grid = list(game_grid(mode, max_players, max_M_A, max_M_B))
+    if shard is not None:
+        grid = shard_games(grid, *shard)
+        results_csv, performance_json = shard_paths(mode, *shard)
+
+    # Look up games solved in earlier runs
+    cache = ResultCache(cache_path) if cache_path is not None else None
+    with instrumentation.stage("cache.lookup"):
+        cached_solutions = cache.get_many(grid) if cache is not None else {}
+    if cache is not None:
+        print(f"{len(cached_solutions)} of {len(grid)} games served from {cache_path}.")
+
+    # Add missing games to the store up front, workers only read from it
+    if game_store_path is not None and solver != "canonical":
+        with instrumentation.stage("game.store_prefill"), GameStore(game_store_path, mode="a") as game_store:
+            for R, M_A, M_B in grid:
+                if (R, M_A, M_B) not in game_store and (R, M_A, M_B) not in cached_solutions:
+                    game_store.add((R, M_A, M_B), *scaled_game_payoffs(R, M_A, M_B))
 
     # Performance trackers for different prediction types
-    rule_performance_signature = {}
-    rule_performance_nash_count = {}
-    rule_performance_nash_location = {}
+    tally = AccuracyTally()
+    chunk_size = max(1, len(grid) // (4 * jobs))
+    new_solutions = []
 
-    with open(results_csv, "w", newline='') as csv_file:
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow([
-            "R", "M_A", "M_B",
-            "PredictedSignature", "TrueSignature", "SigPredTrue?", "SigRuleUsed",
-            "PredictedNumPureNash", "TrueNumPureNash", "NumPredTrue?", "NumRuleUsed",
-            "PredNashLoc", "TrueNashLoc", "LocPredTrue?", "LocRuleUsed"
-        ])
-
-        for R in player_range:
-            for M_A in strategy_a_range:
-                for M_B in range(M_A, max_M_B):
-                    if mode == "symmetric" and M_A != M_B:
-                        continue
-                    if mode == "asymmetric" and M_A == M_B:
-                        continue
-
-                    game_filename = f"{R}_{M_A}_{M_B}.csv"
-                    game_path = os.path.join(games_dir, game_filename)
-
-                    if not os.path.exists(game_path):
-                        create_game(R, M_A, M_B, SAVE_PATH=game_path)
-
-                    # Predict signature and rule
-                    predicted_p1, predicted_p2, sig_rule_used = predict_signature(R, M_A, M_B)
-                    predicted_signature = (sorted(predicted_p1 or []), sorted(predicted_p2 or []))
-
-                    # Load game and calculate Nash equilibria
-                    game_instance = PayoffMatrix(file_source=game_path)
-                    equilibrium_results, _ = IESDS(game_instance, show_steps=False)
-                    equilibrium_results = [(int(eq[0]), int(eq[1])) for eq in equilibrium_results]
-
-                    num_nash_equilibria = len(equilibrium_results)
-                    true_signature = (
-                        sorted([int(s) for s in game_instance.p1_strategies]),
-                        sorted([int(s) for s in game_instance.p2_strategies])
-                    )
-
-                    # Predict the number and locations of pure Nash equilibria
-                    predicted_nash_count, predicted_nash_locs, nash_rule_used = predict_pure_nash_with_locations(R, M_A, M_B)
-                    predicted_nash_locs_str = str(predicted_nash_locs)
-                    true_nash_locs_str = str(equilibrium_results)
-
-                    # Determine prediction correctness
-                    sig_pred_correct = "Yes" if predicted_signature == true_signature else "No"
-                    num_pred_correct = "Yes" if predicted_nash_count == num_nash_equilibria else "No"
-                    loc_pred_correct = "Yes" if predicted_nash_locs_str == true_nash_locs_str else "No"
-
-                    # Update performance trackers
-                    for rule, correct, tracker in [
-                        (sig_rule_used, sig_pred_correct, rule_performance_signature),
-                        (nash_rule_used, num_pred_correct, rule_performance_nash_count),
-                        (nash_rule_used, loc_pred_correct, rule_performance_nash_location)
-                    ]:
-                        if rule not in tracker:
-                            tracker[rule] = {"correct": 0, "incorrect": 0}
-                        if correct == "Yes":
-                            tracker[rule]["correct"] += 1
-                        else:
-                            tracker[rule]["incorrect"] += 1
-
-                    # Write results to CSV
-                    csv_writer.writerow([
-                        R, M_A, M_B,
-                        str(predicted_signature), str(true_signature), sig_pred_correct, sig_rule_used,
-                        predicted_nash_count, num_nash_equilibria, num_pred_correct, nash_rule_used,
-                        predicted_nash_locs_str, true_nash_locs_str, loc_pred_correct, nash_rule_used
-                    ])
+    # Results are streamed to all outputs as they arrive, the sorted copy is only
+    # written for full sweeps, shards are sorted after merging
+    sorted_path = sorted_csv_path(results_csv) if shard is None else None
+    with ResultWriter(csv_path=results_csv, arrow_path=arrow_path, sorted_csv_path=sorted_path) as writer:
+        # Results arrive in grid order, whatever the number of workers
+        for record in sweep(grid, solver=solver, chunk_size=chunk_size, jobs=jobs, games_dir=games_dir,
+                            game_store_path=game_store_path, cached_solutions=cached_solutions):
+            with instrumentation.stage("write"):
+                writer.write(record)
+            tally(record)
+            key = (record["R"], record["M_A"], record["M_B"])
+            if cache is not None and key not in cached_solutions:
+                new_solutions.append((key, (record["true_signature"], record["true_nash_locations"])))
+                if len(new_solutions) >= chunk_size:
+                    with instrumentation.stage("cache.write"):
+                        cache.put_many(new_solutions)
+                    new_solutions = []
+
+    if cache is not None:
+        if new_solutions:
+            cache.put_many(new_solutions)
+        cache.close()
+    rule_performance = tally.rule_performance
 
     # Print accuracy for each prediction type
-    print("\n=== Signature Prediction Accuracy ===")
-    print_rule_performance(rule_performance_signature)
+    print_accuracy_report(rule_performance)
 
-    print("\n=== Nash Count Prediction Accuracy ===")
-    print_rule_performance(rule_performance_nash_count)
+    print(f"Results saved to {results_csv}.")
+    if arrow_path is not None:
+        print(f"Typed results saved to {arrow_path}.")
+    if shard is not None:
+        with open(performance_json, "w") as json_file:
+            json.dump({"mode": mode, "shard": shard[0], "num_shards": shard[1], "games": len(grid),
+                       "rule_performance": rule_performance}, json_file, indent=2)
+        print(f"Rule performance saved to {performance_json}.")
+    else:
+        print(f"Sorted results saved to: {sorted_path}")
 
-    print("\n=== Nash Location Prediction Accuracy ===")
-    print_rule_performance(rule_performance_nash_location)
+    if instrument_path is not None:
+        collected = instrumentation.disable()
+        collected.add_time("total", time.perf_counter() - start_time)
+        collected.save(instrument_path)
+        print(f"Instrumentation saved to {instrument_path}.")
 
-    print(f"Results saved to {results_csv}.")
-    sort_csv_by_columns(results_csv)
+def parse_shard(value):
+    """
+    Parses a "i/n" shard selector into (i, n).
+    """
+    try:
+        shard, num_shards = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard as i/n, got {value!r}")
+    if not 1 <= shard <= num_shards:
+        raise argparse.ArgumentTypeError(f"Shard {shard} is not in 1..{num_shards}")
+    return shard, num_shards
 
 if __name__ == "__main__":
-    simulate_games_with_nash_predictions(mode="all")
+    parser = argparse.ArgumentParser(description="Simulate tie-sharing games and evaluate the conjectures.")
+    parser.add_argument("--mode", default="all", choices=["all", "symmetric", "asymmetric"])
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes, 0 uses all cores.")
+    parser.add_argument("--games-dir", default=None, help="Directory to persist game CSV files in.")
+    parser.add_argument("--game-store", default=None, help="Binary game store to persist games in.")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only run shard i of n (as i/n) and write partial result files.")
+    parser.add_argument("--solver", default="iesds", choices=["iesds", "batch", "canonical"],
+                        help="Solve games one by one, in batches with the tensor solver, "
+                             "or through their memoized canonical games.")
+    parser.add_argument("--cache", default=None,
+                        help="SQLite result cache, games solved by the current solver are not solved again.")
+    parser.add_argument("--arrow", default=None, metavar="PATH",
+                        help="Also write the results with typed columns to an Arrow IPC file (requires pyarrow).")
+    parser.add_argument("--merge-shards", type=int, default=None, metavar="N",
+                        help="Merge the partial result files of N shards instead of running a sweep.")
+    parser.add_argument("--instrument", default=None, metavar="PATH",
+                        help="Save per-stage wall times and event counters of the sweep to a JSON file.")
+    parser.add_argument("--instrument-per-game", action="store_true",
+                        help="With --instrument, also save the solve time and counters of every game.")
+    parser.add_argument("--profile-game", type=int, nargs=3, default=None, metavar=("R", "M_A", "M_B"),
+                        help="Solve and evaluate a single game under cProfile with --solver and print the profile.")
+    parser.add_argument("--search", action="store_true",
+                        help="Search for counterexamples near the rule boundaries instead of running a sweep.")
+    parser.add_argument("--max-R", type=int, default=1000, help="Exclusive upper bound for R in --search.")
+    parser.add_argument("--max-M", type=int, default=1000, help="Upper bound for M_A and M_B in --search.")
+    parser.add_argument("--max-evaluations", type=int, default=1000,
+                        help="Maximum number of games verified by --search.")
+    args = parser.parse_args()
+
+    if args.merge_shards is not None:
+        merge_shards(args.mode, args.merge_shards)
+    elif args.profile_game is not None:
+        instrumentation.profile(evaluate_games, [tuple(args.profile_game)], solver=args.solver)
+    elif args.search:
+        print_counterexamples(search_counterexamples(max_R=args.max_R, max_M=args.max_M,
+                                                     max_evaluations=args.max_evaluations))
+    else:
+        simulate_games_with_nash_predictions(mode=args.mode, games_dir=args.games_dir,
+                                             game_store_path=args.game_store, jobs=args.jobs,
+                                             shard=args.shard, solver=args.solver, cache_path=args.cache,
+                                             arrow_path=args.arrow, instrument_path=args.instrument,
+                                             per_game=args.instrument_per_game)
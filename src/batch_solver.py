@@ -0,0 +1,144 @@
+import numpy as np
+
+from src.payoff_matrix import DOMINANCE_BLOCK_ELEMENTS
+
+
+def pad_games(games):
+    """
+    Stacks games of different sizes into one padded payoff tensor.
+
+    Parameters:
+    - games (list): List of PayoffMatrix objects.
+
+    Returns:
+    - tuple: (payoffs, p1_valid, p2_valid), where payoffs has shape
+      (n_games, rows, cols, 2) in the common dtype of the games and the boolean masks of shape
+      (n_games, rows) and (n_games, cols) mark the real strategies of each game.
+    """
+    rows = max(game.payoffs.shape[0] for game in games)
+    cols = max(game.payoffs.shape[1] for game in games)
+    # games are only compared internally, so games with different scales can share the array
+    payoffs = np.zeros((len(games), rows, cols, 2), dtype=np.result_type(*(game.payoffs for game in games)))
+    p1_valid = np.zeros((len(games), rows), dtype=bool)
+    p2_valid = np.zeros((len(games), cols), dtype=bool)
+    for k, game in enumerate(games):
+        n, m = game.payoffs.shape[:2]
+        payoffs[k, :n, :m] = game.payoffs
+        p1_valid[k, :n] = True
+        p2_valid[k, :m] = True
+    return payoffs, p1_valid, p2_valid
+
+
+def _strictly_dominated(player_payoffs, own_alive, opp_alive):
+    # player_payoffs[k, i, l]: payoff of strategy i against opponent strategy l in game k.
+    # Strategy i is dominated if some surviving j beats it against every surviving opponent strategy.
+    # Like dominance_matrix, a block of strategies i is compared at a time to bound the memory.
+    n_games, n_strategies, n_opp_strategies = player_payoffs.shape
+    block_size = max(1, DOMINANCE_BLOCK_ELEMENTS // max(1, n_games * n_strategies * n_opp_strategies))
+    opp_dead = ~opp_alive[:, None, None, :]
+    dominated = np.empty((n_games, n_strategies), dtype=bool)
+    for start in range(0, n_strategies, block_size):
+        less = player_payoffs[:, start:start + block_size, None, :] < player_payoffs[:, None, :, :]
+        less |= opp_dead
+        dominated[:, start:start + block_size] = (less.all(axis=3) & own_alive[:, None, :]).any(axis=2)
+    return dominated & own_alive
+
+
+def solve_batch(payoffs, p1_valid=None, p2_valid=None):
+    """
+    Runs IESDS and pure Nash equilibrium detection on a stack of games at once.
+
+    In every round, all strictly dominated strategies of player 1 and then of
+    player 2 are removed in every game of the batch that changed in the
+    previous round, until no game changes.
+    The reduced forms are the same as those of psne.IESDS, as strict dominance
+    elimination does not depend on the order.
+
+    Parameters:
+    - payoffs (np.ndarray): Array of shape (n_games, rows, cols, 2).
+    - p1_valid (np.ndarray, optional): Boolean mask of shape (n_games, rows) of real rows.
+    - p2_valid (np.ndarray, optional): Boolean mask of shape (n_games, cols) of real columns.
+
+    Returns:
+    - tuple: (p1_surviving, p2_surviving, is_equilibrium), boolean masks of
+      shapes (n_games, rows), (n_games, cols) and (n_games, rows, cols).
+    """
+    n_games, rows, cols = payoffs.shape[:3]
+    p1_alive = np.ones((n_games, rows), dtype=bool) if p1_valid is None else p1_valid.copy()
+    p2_alive = np.ones((n_games, cols), dtype=bool) if p2_valid is None else p2_valid.copy()
+    p1_payoffs = payoffs[..., 0]
+    p2_payoffs = np.swapaxes(payoffs[..., 1], 1, 2)
+
+    # games that lost no strategy in a round are finished and drop out of the following rounds
+    active = np.arange(n_games)
+    while active.size:
+        p1_dominated = _strictly_dominated(p1_payoffs[active], p1_alive[active], p2_alive[active])
+        p1_alive[active] &= ~p1_dominated
+        p2_dominated = _strictly_dominated(p2_payoffs[active], p2_alive[active], p1_alive[active])
+        p2_alive[active] &= ~p2_dominated
+        active = active[p1_dominated.any(axis=1) | p2_dominated.any(axis=1)]
+
+    # best responses among the surviving strategies, dead cells can never be a maximum
+    cell_alive = p1_alive[:, :, None] & p2_alive[:, None, :]
+    lowest = np.iinfo(payoffs.dtype).min if payoffs.dtype.kind in 'iu' else -np.inf
+    p1_masked = np.where(cell_alive, p1_payoffs, lowest)
+    p2_masked = np.where(cell_alive, payoffs[..., 1], lowest)
+    p1_is_best_response = p1_masked == p1_masked.max(axis=1, keepdims=True)
+    p2_is_best_response = p2_masked == p2_masked.max(axis=2, keepdims=True)
+    return p1_alive, p2_alive, p1_is_best_response & p2_is_best_response & cell_alive
+
+
+def _split_per_game(mask):
+    # nonzero indices of each game in a batch mask, as lists of python ints per axis
+    indices = np.nonzero(mask)
+    bounds = np.cumsum(mask.reshape(len(mask), -1).sum(axis=1))[:-1]
+    per_axis = [np.split(axis_indices, bounds) for axis_indices in indices[1:]]
+    return [[axis[b].tolist() for axis in per_axis] for b in range(len(mask))]
+
+
+def solve_games(games):
+    """
+    Solves a list of games with solve_batch.
+
+    Games are sorted by size and solved in blocks whose padded pairwise
+    comparisons fit into DOMINANCE_BLOCK_ELEMENTS, to limit padding. Within a
+    block, the comparisons are split further to bound the memory.
+
+    Parameters:
+    - games (list): List of PayoffMatrix objects, they are not modified.
+
+    Returns:
+    - list: For each game, a tuple (p1_strategies, p2_strategies, equilibria)
+      with the surviving strategy names and the pure Nash equilibria, in the
+      same order as psne.IESDS returns them.
+    """
+    results = [None] * len(games)
+    order = sorted(range(len(games)), key=lambda k: games[k].payoffs.shape[:2])
+    start = 0
+    while start < len(order):
+        # grow the block while the comparisons of a round, over the padded shape of the block, stay within the
+        # budget; player 1 compares rows^2 * cols and player 2 cols^2 * rows payoffs per game
+        stop = start + 1
+        rows, cols = games[order[start]].payoffs.shape[:2]
+        while stop < len(order):
+            padded_rows = max(rows, games[order[stop]].payoffs.shape[0])
+            padded_cols = max(cols, games[order[stop]].payoffs.shape[1])
+            if (stop - start + 1) * padded_rows * padded_cols * max(padded_rows, padded_cols) \
+                    > DOMINANCE_BLOCK_ELEMENTS:
+                break
+            rows, cols = padded_rows, padded_cols
+            stop += 1
+        block = [games[k] for k in order[start:stop]]
+        p1_alive, p2_alive, is_equilibrium = solve_batch(*pad_games(block))
+        # extract the indices of all games at once and split them per game
+        p1_indices = _split_per_game(p1_alive)
+        p2_indices = _split_per_game(p2_alive)
+        equilibrium_indices = _split_per_game(is_equilibrium)
+        for b, k in enumerate(order[start:stop]):
+            game = games[k]
+            p1_strategies = [game.p1_strategies[i] for i in p1_indices[b][0]]
+            p2_strategies = [game.p2_strategies[j] for j in p2_indices[b][0]]
+            equilibria = [(game.p1_strategies[i], game.p2_strategies[j]) for i, j in zip(*equilibrium_indices[b])]
+            results[k] = (p1_strategies, p2_strategies, equilibria)
+        start = stop
+    return results
@@ -0,0 +1,92 @@
+from functools import lru_cache
+
+from src.create_game import create_game
+from src.psne import IESDS
+
+
+def canonical_game(R, M_A, M_B):
+    """
+    Maps a tie-sharing game to the smallest game with the same reduced form.
+
+    Two facts about strict dominance shrink the game without changing the
+    result of IESDS, which does not depend on the elimination order:
+    - any investment above R is strictly dominated by investing 0, since it
+      always has a negative payoff;
+    - if the other player invests at most m, any investment above m + 1 is
+      strictly dominated by m + 1, since both always win.
+    Games that only differ by the order of the players are mirror images, so
+    the canonical game has M_A <= M_B.
+
+    Parameters:
+    - R (int): Investment budget of the game.
+    - M_A (int): Maximum investment for player A.
+    - M_B (int): Maximum investment for player B.
+
+    Returns:
+    - tuple: ((R, M_min', M_max'), swapped), where swapped tells whether
+      the players were exchanged.
+    """
+    swapped = M_A > M_B
+    M_min, M_max = (M_B, M_A) if swapped else (M_A, M_B)
+    M_min = min(M_min, R)
+    M_max = min(M_max, R, M_min + 1)
+    return (R, M_min, M_max), swapped
+
+
+@lru_cache(maxsize=None)
+def _solve_canonical(R, M_A, M_B):
+    game_instance = create_game(R, M_A, M_B)
+    equilibrium_results, _ = IESDS(game_instance, show_steps=False, batched=True)
+    equilibrium_results = tuple((int(eq[0]), int(eq[1])) for eq in equilibrium_results)
+    true_signature = (
+        tuple(sorted(int(s) for s in game_instance.p1_strategies)),
+        tuple(sorted(int(s) for s in game_instance.p2_strategies))
+    )
+    return true_signature, equilibrium_results
+
+
+def solve(R, M_A, M_B):
+    """
+    Returns the true signature and pure Nash equilibria of a game, solving
+    only its canonical game. Results are memoized per canonical game.
+
+    Returns:
+    - tuple: (true_signature, equilibrium_results) in the same form as a
+      full solve: sorted strategy lists of both players and the list of
+      equilibria ordered by player A's then player B's strategy.
+    """
+    key, swapped = canonical_game(R, M_A, M_B)
+    (p1_signature, p2_signature), equilibria = _solve_canonical(*key)
+    if swapped:
+        p1_signature, p2_signature = p2_signature, p1_signature
+        equilibria = sorted((b, a) for a, b in equilibria)
+    return (list(p1_signature), list(p2_signature)), list(equilibria)
+
+
+def cache_info():
+    """Returns hit/miss statistics of the memoized canonical solves."""
+    return _solve_canonical.cache_info()
+
+
+def verify_canonicalization(max_R=12, max_M=15):
+    """
+    Compares solve() with full solves of every game with 1 <= R < max_R and
+    1 <= M_A, M_B < max_M, in both player orders.
+
+    Returns:
+    - list: The (R, M_A, M_B) of all games where the results differ.
+    """
+    mismatches = []
+    for R in range(1, max_R):
+        for M_A in range(1, max_M):
+            for M_B in range(1, max_M):
+                game_instance = create_game(R, M_A, M_B)
+                equilibrium_results, _ = IESDS(game_instance, show_steps=False, batched=True)
+                full = (
+                    (sorted(int(s) for s in game_instance.p1_strategies),
+                     sorted(int(s) for s in game_instance.p2_strategies)),
+                    [(int(eq[0]), int(eq[1])) for eq in equilibrium_results]
+                )
+                if solve(R, M_A, M_B) != full:
+                    mismatches.append((R, M_A, M_B))
+    return mismatches
@@ -0,0 +1,194 @@
+import heapq
+import math
+import random
+import time
+
+from src.canonical import canonical_game, solve
+from src.sweep import evaluate_game
+
+# trackers and the record fields of their rule and correctness
+TRACKERS = (
+    ("signature", "signature_rule", "signature_correct"),
+    ("nash_count", "nash_rule", "num_nash_correct"),
+    ("nash_location", "nash_rule", "nash_locations_correct"),
+)
+
+
+def rule_boundaries(R):
+    """
+    Returns the values of M_min at which the predicted rules change for a given R:
+    R / 2 rounded down and up (rules 2/3, 4/5 and Ca/Cb) and R (rules 5/6).
+    """
+    return sorted({R // 2, math.ceil(R / 2), R})
+
+
+def boundary_distance(R, M_min, M_max):
+    """
+    Returns how far a game is from the nearest rule boundary, 0 for games on one.
+
+    The distance is the distance of M_min to the nearest boundary of
+    rule_boundaries, plus one if M_max is more than one above M_min, since
+    the symmetric rules and the reduced forms change between M_max = M_min
+    and M_max = M_min + 1.
+    """
+    return min(abs(M_min - b) for b in rule_boundaries(R)) + (M_max - M_min > 1)
+
+
+def boundary_candidates(R_values, max_M, radius=2):
+    """
+    Yields games (R, M_min, M_max) near the rule boundaries of every R.
+
+    For each boundary b of rule_boundaries(R), M_min ranges over b - radius to
+    b + radius, and M_max is M_min (symmetric), M_min + 1 (the first
+    asymmetric game) or max_M (the largest asymmetric game).
+
+    Parameters:
+    - R_values (iterable): Investment budgets to search.
+    - max_M (int): Largest maximum investment of a player.
+    - radius (int): Distance to the boundaries to cover.
+    """
+    for R in R_values:
+        seen = set()
+        for b in rule_boundaries(R):
+            for M_min in range(max(1, b - radius), min(max_M, b + radius) + 1):
+                for M_max in (M_min, M_min + 1, max_M):
+                    if M_max <= max_M and (M_min, M_max) not in seen:
+                        seen.add((M_min, M_max))
+                        yield R, M_min, M_max
+
+
+def R_bucket(R):
+    """
+    Returns the geometric scale of R: bucket b holds 2^b <= R < 2^(b + 1).
+    """
+    return R.bit_length() - 1
+
+
+def verification_cost(R, M_A, M_B):
+    """
+    Estimates the cost of verifying a game, by the size of its canonical game.
+    """
+    (_, M_min, M_max), _ = canonical_game(R, M_A, M_B)
+    return (M_min + 1) * (M_max + 1)
+
+
+def _neighbours(game, max_R, max_M):
+    R, M_min, M_max = game
+    for dR in (-1, 0, 1):
+        for dA in (-1, 0, 1):
+            for dB in (-1, 0, 1):
+                neighbour = (R + dR, M_min + dA, M_max + dB)
+                if 1 <= neighbour[0] < max_R and 1 <= neighbour[1] <= neighbour[2] <= max_M and neighbour != game:
+                    yield neighbour
+
+
+def search_counterexamples(max_R=1000, max_M=1000, R_values=None, radius=2, max_evaluations=1000,
+                           max_seconds=None, patience=None, evaluate=evaluate_game, seed=0):
+    """
+    Searches for games where the signature or Nash conjectures are wrong,
+    starting at the rule boundaries where mispredictions are most likely.
+
+    Games are verified in order of their boundary distance, by solving them
+    with IESDS through their canonical game. Games at the same distance are
+    taken round-robin from the geometric R buckets of R_bucket, in a random
+    order within each bucket, so a limited budget probes every scale of R
+    up to the thousands instead of exhausting small R first. When a
+    counterexample is found, its neighbours are verified next, so clusters
+    of counterexamples are mapped. Only games with M_A <= M_B are searched,
+    the others are mirror images.
+
+    The search probes a sample of the games, so the minimal counterexample
+    of a rule is the smallest among the games it verified, not necessarily
+    the smallest counterexample of the rule.
+
+    Parameters:
+    - max_R (int): Exclusive upper bound for R.
+    - max_M (int): Inclusive upper bound for M_A and M_B.
+    - R_values (iterable, optional): Investment budgets to start from, defaults to range(1, max_R).
+    - radius (int): Distance to the rule boundaries of the starting games.
+    - max_evaluations (int): Maximum number of games to verify.
+    - max_seconds (float, optional): Stop after this time.
+    - patience (int, optional): Stop after this many verified games without a new counterexample.
+    - evaluate (callable): Scores a solved game, with the signature of src.sweep.evaluate_game.
+    - seed (int, optional): Seed of the order of the games within an R bucket.
+
+    Returns:
+    - dict: {"evaluations": n, "stopped": reason, "counterexamples": {tracker: {rule: [records]}},
+      "minimal": {tracker: {rule: record}}}, where minimal holds the smallest verified
+      counterexample of each rule, ordered by (R, M_A, M_B).
+    """
+    if R_values is None:
+        R_values = range(1, max_R)
+    queue = []
+    seen = set()
+
+    def push(game, distance, rank=0):
+        if game not in seen:
+            seen.add(game)
+            heapq.heappush(queue, (distance, rank, verification_cost(*game), game))
+
+    # the rank of a game is its position within its R bucket and distance, so equal ranks of all
+    # buckets come one after the other
+    buckets = {}
+    for game in boundary_candidates(R_values, max_M, radius):
+        distance = boundary_distance(*game)
+        buckets.setdefault((R_bucket(game[0]), distance), []).append(game)
+    rng = random.Random(seed)
+    for (_, distance), games in sorted(buckets.items()):
+        rng.shuffle(games)
+        for rank, game in enumerate(games):
+            push(game, distance, rank)
+
+    counterexamples = {tracker: {} for tracker, _, _ in TRACKERS}
+    evaluations = 0
+    since_last_found = 0
+    start = time.perf_counter()
+    stopped = "exhausted"
+    while queue:
+        if evaluations >= max_evaluations:
+            stopped = "max_evaluations"
+            break
+        if max_seconds is not None and time.perf_counter() - start > max_seconds:
+            stopped = "max_seconds"
+            break
+        if patience is not None and since_last_found >= patience:
+            stopped = "patience"
+            break
+
+        game = heapq.heappop(queue)[-1]
+        record = evaluate(*game, *solve(*game))
+        evaluations += 1
+        since_last_found += 1
+
+        found = False
+        for tracker, rule_field, correct_field in TRACKERS:
+            if not record[correct_field]:
+                counterexamples[tracker].setdefault(record[rule_field], []).append(record)
+                found = True
+        if found:
+            since_last_found = 0
+            # refine around the counterexample before continuing along the boundaries
+            for neighbour in _neighbours(game, max_R, max_M):
+                push(neighbour, -1)
+
+    minimal = {
+        tracker: {rule: min(records, key=lambda record: (record["R"], record["M_A"], record["M_B"]))
+                  for rule, records in rules.items()}
+        for tracker, rules in counterexamples.items()
+    }
+    return {"evaluations": evaluations, "stopped": stopped,
+            "counterexamples": counterexamples, "minimal": minimal}
+
+
+def print_counterexamples(report):
+    """
+    Prints the minimal counterexample of each rule found by search_counterexamples.
+    """
+    print(f"Verified {report['evaluations']} games, stopped: {report['stopped']}.")
+    for tracker, rules in report["minimal"].items():
+        if not rules:
+            print(f"{tracker}: no counterexamples found.")
+        for rule, record in rules.items():
+            count = len(report["counterexamples"][tracker][rule])
+            print(f"{tracker}, {rule}: {count} counterexamples, minimal (R, M_A, M_B) = "
+                  f"({record['R']}, {record['M_A']}, {record['M_B']})")
@@ -2,35 +2,74 @@ import numpy as np
 import csv
 import os
 
-def create_game(I, M_A, M_B, SAVE_PATH):
+from src.payoff_matrix import PayoffMatrix, compact_int_dtype
+
+
+def game_payoffs(I, M_A, M_B):
     """
-    Generates payoff matrices for players A and B based on the game rules
-    and saves them to a CSV file.
+    Computes the payoff tensor of a tie-sharing game in closed form.
 
     Parameters:
     - I (int): Investment budget available to the investor.
     - M_A (int): Maximum investment for player A.
     - M_B (int): Maximum investment for player B.
+
+    Returns:
+    - np.ndarray: Array of shape (M_A + 1, M_B + 1, 2) holding the payoffs of
+      player A in [..., 0] and of player B in [..., 1].
+    """
+    C_A = np.arange(M_A + 1)[:, None]
+    C_B = np.arange(M_B + 1)[None, :]
+
+    # Comparison masks for who invests more; the remaining cells are ties
+    a_wins = C_A > C_B
+    b_wins = C_A < C_B
+
+    payoffs = np.empty((M_A + 1, M_B + 1, 2))
+    payoffs[..., 0] = np.where(a_wins, I - C_A, np.where(b_wins, -C_A, I / 2 - C_A))
+    payoffs[..., 1] = np.where(b_wins, I - C_B, np.where(a_wins, -C_B, I / 2 - C_B))
+    return payoffs
+
+
+def scaled_game_payoffs(I, M_A, M_B):
+    """
+    Computes the payoff tensor of a tie-sharing game with an integer budget
+    exactly, as integers in half units where needed.
+
+    Parameters:
+    - I (int): Investment budget available to the investor.
+    - M_A (int): Maximum investment for player A.
+    - M_B (int): Maximum investment for player B.
+
+    Returns:
+    - tuple: (payoffs, scale), where payoffs is an integer array of shape
+      (M_A + 1, M_B + 1, 2) in the smallest dtype holding all payoffs and
+      payoffs / scale are the payoffs of game_payoffs. The scale is 1 for
+      even I and 2 for odd I.
+    """
+    scale = 1 if I % 2 == 0 else 2
+    dtype = compact_int_dtype(np.array([scale * (abs(I) + max(M_A, M_B))]))
+    C_A = np.arange(M_A + 1, dtype=dtype)[:, None]
+    C_B = np.arange(M_B + 1, dtype=dtype)[None, :]
+
+    # Comparison masks for who invests more; the remaining cells are ties
+    a_wins = C_A > C_B
+    b_wins = C_A < C_B
+
+    payoffs = np.empty((M_A + 1, M_B + 1, 2), dtype=dtype)
+    payoffs[..., 0] = np.where(a_wins, scale * (I - C_A), np.where(b_wins, -scale * C_A, scale * I // 2 - scale * C_A))
+    payoffs[..., 1] = np.where(b_wins, scale * (I - C_B), np.where(a_wins, -scale * C_B, scale * I // 2 - scale * C_B))
+    return payoffs, scale
+
+
+def save_game(payoffs, SAVE_PATH):
+    """
+    Writes a payoff tensor to a CSV file with one "a,b" cell per strategy pair.
+
+    Parameters:
+    - payoffs (np.ndarray): Array of shape (rows, cols, 2).
     - SAVE_PATH (str): Path (including filename) to save the CSV file.
     """
-    # Initialize payoff matrices
-    payoff_A = np.zeros((M_A + 1, M_B + 1))
-    payoff_B = np.zeros((M_A + 1, M_B + 1))
-
-    # Compute payoffs for each combination of strategies (C_A, C_B)
-    for C_A in range(M_A + 1):
-        for C_B in range(M_B + 1):
-            if C_A > C_B:
-                payoff_A[C_A, C_B] = I - C_A
-                payoff_B[C_A, C_B] = -C_B
-            elif C_A < C_B:
-                payoff_A[C_A, C_B] = -C_A
-                payoff_B[C_A, C_B] = I - C_B
-            else:  # C_A == C_B
-                payoff_A[C_A, C_B] = I / 2 - C_A
-                payoff_B[C_A, C_B] = I / 2 - C_B
-
-    # Write the game to a CSV file
     # Ensure directory exists
     directory = os.path.dirname(SAVE_PATH)
     if directory and not os.path.exists(directory):
@@ -41,12 +80,38 @@ def create_game(I, M_A, M_B, SAVE_PATH):
 
         # Write header (player B strategies)
         header = [""]
-        header.extend(range(M_B + 1))
+        header.extend(range(payoffs.shape[1]))
         writer.writerow(header)
 
         # Write rows with player A strategies and corresponding payoffs
-        for C_A in range(M_A + 1):
+        for C_A in range(payoffs.shape[0]):
             row = [C_A]
-            for C_B in range(M_B + 1):
-                row.append(f'{payoff_A[C_A, C_B]},{payoff_B[C_A, C_B]}')
+            for C_B in range(payoffs.shape[1]):
+                row.append(f'{payoffs[C_A, C_B, 0]},{payoffs[C_A, C_B, 1]}')
             writer.writerow(row)
+
+
+def create_game(I, M_A, M_B, SAVE_PATH=None):
+    """
+    Generates the payoff matrix for players A and B based on the game rules
+    and optionally saves it to a CSV file.
+
+    Parameters:
+    - I (int): Investment budget available to the investor.
+    - M_A (int): Maximum investment for player A.
+    - M_B (int): Maximum investment for player B.
+    - SAVE_PATH (str, optional): Path (including filename) to save the CSV file.
+
+    Returns:
+    - PayoffMatrix: The game, ready to be passed to the solver.
+    """
+    if float(I).is_integer():
+        payoffs, scale = scaled_game_payoffs(int(I), M_A, M_B)
+        if SAVE_PATH is not None:
+            save_game(payoffs / scale, SAVE_PATH)
+        return PayoffMatrix(payoffs=payoffs, copy_payoffs=False, scale=scale)
+
+    payoffs = game_payoffs(I, M_A, M_B)
+    if SAVE_PATH is not None:
+        save_game(payoffs, SAVE_PATH)
+    return PayoffMatrix(payoffs=payoffs)
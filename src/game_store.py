@@ -0,0 +1,179 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from src.payoff_matrix import PayoffMatrix, scale_payoffs
+
+MAGIC = b'TPTSGST1'
+# the file ends with the byte offset of the JSON index followed by the magic bytes
+FOOTER = struct.Struct('<Q8s')
+DTYPE = np.dtype('<i4')
+
+
+def _index_entries(data, end):
+    # the index entries whose footer ends at byte end of the file, or None if there is no valid index
+    if end < len(MAGIC) + FOOTER.size:
+        return None
+    index_offset, magic = FOOTER.unpack(data[end - FOOTER.size:end])
+    if magic != MAGIC or not len(MAGIC) <= index_offset <= end - FOOTER.size:
+        return None
+    try:
+        entries = json.loads(data[index_offset:end - FOOTER.size])
+    except ValueError:
+        return None
+    return entries if isinstance(entries, list) else None
+
+
+class GameStore:
+    """
+    Container file holding the payoff tensors of many games.
+
+    Every game is keyed by its parameters, e.g. (R, M_A, M_B), and stored as
+    a contiguous block of int32 values of shape (rows, cols, 2). Payoffs that
+    are not integers are stored in half units together with their scale, so
+    the exact payoffs are stored / scale, as in PayoffMatrix. An index mapping keys to offset,
+    shape and scale is written at the end of the file when the store is closed.
+
+    Games added to an existing store are appended after its index, which
+    stays in place until the new index is written after them. If a process
+    adding games crashes before close(), the store is read with its last
+    complete index, and only the games added since are lost.
+
+    Stored games are read through a single read-only memory map, so opening a
+    game does not copy its payoffs and several processes can share the file.
+
+    Parameters:
+    - path (str): Path of the container file.
+    - mode (str): 'r' to open an existing store read-only, 'a' to open or
+      create a store and add games to it.
+    """
+
+    def __init__(self, path, mode='r'):
+        if mode not in ('r', 'a'):
+            raise ValueError(f"mode must be 'r' or 'a', got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.index = {}
+        self._buffer = None
+        self._file = None
+
+        if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+            end = self._read_index()
+        elif mode == 'r':
+            raise FileNotFoundError(f"No game store at {path}")
+        else:
+            end = None
+
+        if mode == 'a':
+            if end is None:
+                self._file = open(path, 'w+b')
+                self._file.write(MAGIC)
+            else:
+                # keep the old index until a new one is written after the appended games on close,
+                # only the games of a session that did not close the store are dropped
+                self._file = open(path, 'r+b')
+                self._file.truncate(end)
+                self._file.seek(end)
+
+    def _read_index(self):
+        # reads the last complete index and returns the end of its footer
+        with open(self.path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a game store")
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = len(data)
+            entries = _index_entries(data, end)
+            while entries is None:
+                # games were appended without closing the store, look for the footer of the previous index
+                end = data.rfind(MAGIC, len(MAGIC), end - 1) + len(MAGIC)
+                if end < len(MAGIC) + FOOTER.size:
+                    raise ValueError(f"{self.path} was not closed properly, its index is missing")
+                entries = _index_entries(data, end)
+        finally:
+            data.close()
+        self.index = {tuple(key): (offset, tuple(shape), scale) for key, offset, shape, scale in entries}
+        return end
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, key):
+        return tuple(key) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def add(self, key, payoffs, scale=1):
+        """
+        Appends the payoff tensor of a game to the store.
+
+        Parameters:
+        - key (tuple): Game parameters, e.g. (R, M_A, M_B).
+        - payoffs (np.ndarray): Array of shape (rows, cols, 2) with payoffs
+          that are multiples of 1/2, or integer payoffs in units of 1/scale
+          as returned by create_game.scaled_game_payoffs.
+        - scale (int): Scale of integer payoffs.
+        """
+        if self._file is None:
+            raise ValueError("Game store is opened read-only")
+        key = tuple(int(k) for k in key)
+        if key in self.index:
+            raise KeyError(f"Game {key} is already stored")
+
+        scaled = np.asarray(payoffs)
+        if scaled.dtype.kind == 'f':
+            scaled, float_scale = scale_payoffs(scaled)
+            if scaled.dtype.kind == 'f':
+                raise ValueError(f"Payoffs of game {key} are not finite multiples of 1/2")
+            scale *= float_scale
+        if scaled.size and np.abs(scaled).max() > np.iinfo(DTYPE).max:
+            raise ValueError(f"Payoffs of game {key} do not fit into {DTYPE}")
+
+        offset = self._file.tell()
+        self._file.write(np.ascontiguousarray(scaled, dtype=DTYPE).tobytes())
+        self.index[key] = (offset, scaled.shape, scale)
+        # the current memory map does not cover the new block
+        self._buffer = None
+
+    def payoffs(self, key):
+        """
+        Returns the stored payoff tensor of a game as a read-only view into
+        the memory-mapped file, together with its scale.
+        """
+        offset, shape, scale = self.index[tuple(key)]
+        if self._buffer is None:
+            if self._file is not None:
+                self._file.flush()
+            self._buffer = np.memmap(self.path, dtype=np.uint8, mode='r')
+        size = int(np.prod(shape)) * DTYPE.itemsize
+        return self._buffer[offset:offset + size].view(DTYPE).reshape(shape), scale
+
+    def open_game(self, key):
+        """
+        Returns the stored game as a PayoffMatrix with its scale, using the
+        memory-mapped data directly.
+        """
+        payoffs, scale = self.payoffs(key)
+        return PayoffMatrix(payoffs=payoffs, copy_payoffs=False, scale=scale)
+
+    def close(self):
+        """Writes the index and closes the file. Read-only stores only release the memory map."""
+        self._buffer = None
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        entries = [[list(key), offset, list(shape), scale] for key, (offset, shape, scale) in self.index.items()]
+        self._file.write(json.dumps(entries).encode())
+        self._file.write(FOOTER.pack(index_offset, MAGIC))
+        self._file.close()
+        self._file = None
@@ -0,0 +1,224 @@
+import argparse
+from collections import OrderedDict
+import numpy as np
+from src.payoff_matrix import PayoffMatrix
+
+
+def _bits(mask):
+    # indices of the set bits of an integer, in increasing order
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _pairwise_masks(payoffs):
+    # payoffs[i, k] is the payoff of strategy i against opponent strategy k;
+    # worse[i][j] / better[i][j] has bit k set if strategy i does worse / better than j against k
+    n_strategies, n_opp_strategies = payoffs.shape
+    less = payoffs[:, None, :] < payoffs[None, :, :]
+    greater = payoffs[:, None, :] > payoffs[None, :, :]
+
+    def to_ints(bools):
+        packed = np.packbits(bools, axis=2, bitorder='little')
+        return [[int.from_bytes(packed[i, j].tobytes(), 'little') for j in range(n_strategies)]
+                for i in range(n_strategies)]
+
+    return to_ints(less), to_ints(greater)
+
+
+class IEWDSExplorer:
+    """
+    Enumerates every reduced form reachable by iterated elimination of weakly
+    dominated strategies (IEWDS), over all elimination orders.
+
+    Unlike strict dominance, the result of IEWDS depends on the order of the
+    eliminations. The explorer walks the DAG of subgames reachable by
+    eliminating one weakly dominated strategy at a time. A subgame is keyed by
+    the bitmasks of its surviving rows and columns, so a subgame reached by
+    many orders is expanded once: its memo entry maps every reduced form
+    reachable from it to the number of elimination orders leading there.
+
+    The memo holds at most max_memo subgames and evicts the least recently
+    used ones; an evicted subgame is expanded again when it is reached again,
+    which costs time but never changes the result. In symmetric games, a
+    subgame and its mirror image share one memo entry.
+
+    Parameters:
+    - payoff_matrix (PayoffMatrix): Game to explore, it is not modified.
+    - max_memo (int): Maximum number of subgames in the memo table.
+    - use_symmetry (bool): Whether to share memo entries between mirrored subgames of symmetric games.
+    """
+
+    def __init__(self, payoff_matrix, max_memo=1000000, use_symmetry=True):
+        self.payoff_matrix = payoff_matrix
+        self.max_memo = max_memo
+        payoffs = payoff_matrix.payoffs
+        self.n_rows, self.n_columns = payoffs.shape[:2]
+        # bitmask comparisons of both players' strategies, player 2's against the rows
+        self._p1_worse, self._p1_better = _pairwise_masks(payoffs[:, :, 0])
+        self._p2_worse, self._p2_better = _pairwise_masks(payoffs[:, :, 1].T)
+        self.symmetric = use_symmetry and self.n_rows == self.n_columns \
+            and np.array_equal(payoffs[:, :, 0], payoffs[:, :, 1].T)
+        self.memo = OrderedDict()
+        self.stats = {"expanded": 0, "memo_hits": 0, "evictions": 0}
+
+    def weakly_dominated(self, strategies, opp_strategies, player):
+        """
+        Returns the bitmask of the given strategies of a player that are weakly
+        dominated by another of them, against the given opponent strategies.
+        """
+        worse, better = (self._p1_worse, self._p1_better) if player == 1 else (self._p2_worse, self._p2_better)
+        dominated = 0
+        for i in _bits(strategies):
+            worse_i, better_i = worse[i], better[i]
+            for j in _bits(strategies & ~(1 << i)):
+                # i is weakly dominated by j if it never does better and sometimes does worse
+                if not better_i[j] & opp_strategies and worse_i[j] & opp_strategies:
+                    dominated |= 1 << i
+                    break
+        return dominated
+
+    def successors(self, state):
+        """Returns the subgames reached by eliminating one weakly dominated strategy of a subgame."""
+        rows, columns = state
+        children = [(rows & ~(1 << i), columns) for i in _bits(self.weakly_dominated(rows, columns, 1))]
+        children += [(rows, columns & ~(1 << j)) for j in _bits(self.weakly_dominated(columns, rows, 2))]
+        return children
+
+    def _key(self, state):
+        # memo key of a subgame and whether it is the mirror image of the subgame
+        if self.symmetric and state[1] < state[0]:
+            return (state[1], state[0]), True
+        return state, False
+
+    def _lookup(self, state):
+        key, mirrored = self._key(state)
+        forms = self.memo.get(key)
+        if forms is None:
+            return None
+        self.memo.move_to_end(key)
+        self.stats["memo_hits"] += 1
+        return {(form[1], form[0]): n for form, n in forms.items()} if mirrored else forms
+
+    def _store(self, state, forms):
+        key, mirrored = self._key(state)
+        self.memo[key] = {(form[1], form[0]): n for form, n in forms.items()} if mirrored else forms
+        if len(self.memo) > self.max_memo:
+            self.memo.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def explore(self, state=None, max_states=None):
+        """
+        Finds the reduced forms reachable from a subgame, by default the full game.
+
+        The DFS keeps the partial results of the subgames on its stack in the
+        stack frames, so the memo is only a cache and may evict anything.
+
+        Parameters:
+        - state (tuple, optional): (rows, columns) bitmasks of the subgame to start from.
+        - max_states (int, optional): Stop after expanding this many subgames.
+
+        Returns:
+        - dict: Maps the (rows, columns) bitmasks of every reduced form to the
+          number of elimination orders leading to it, or None if max_states was
+          reached before the exploration finished.
+        """
+        if state is None:
+            state = ((1 << self.n_rows) - 1, (1 << self.n_columns) - 1)
+        forms = self._lookup(state)
+        if forms is not None:
+            return forms
+
+        budget = None if max_states is None else self.stats["expanded"] + max_states
+        # frames of [state, unvisited successors, reduced forms found so far]
+        self.stats["expanded"] += 1
+        stack = [[state, iter(self.successors(state)), {}]]
+        while stack:
+            frame = stack[-1]
+            child = next(frame[1], None)
+            if child is not None:
+                child_forms = self._lookup(child)
+                if child_forms is None:
+                    if budget is not None and self.stats["expanded"] >= budget:
+                        return None
+                    self.stats["expanded"] += 1
+                    stack.append([child, iter(self.successors(child)), {}])
+                else:
+                    _add_forms(frame[2], child_forms)
+                continue
+            # all successors are done; a subgame without any is a reduced form itself
+            stack.pop()
+            forms = frame[2] or {frame[0]: 1}
+            self._store(frame[0], forms)
+            if stack:
+                _add_forms(stack[-1][2], forms)
+        return forms
+
+    def reduced_game(self, state):
+        """Returns a copy of the game reduced to a (rows, columns) subgame."""
+        reduced = PayoffMatrix(payoffs=self.payoff_matrix.payoffs, p1_strategies=self.payoff_matrix.p1_strategies,
+                               p2_strategies=self.payoff_matrix.p2_strategies, copy_payoffs=False,
+                               scale=self.payoff_matrix.scale)
+        reduced.keep_strategies(list(_bits(state[0])), list(_bits(state[1])))
+        return reduced
+
+    def strategies(self, state):
+        """Returns the strategy names of both players surviving in a (rows, columns) subgame."""
+        return ([self.payoff_matrix.p1_strategies[i] for i in _bits(state[0])],
+                [self.payoff_matrix.p2_strategies[j] for j in _bits(state[1])])
+
+
+def _add_forms(target, forms):
+    for form, n in forms.items():
+        target[form] = target.get(form, 0) + n
+
+
+def reduced_forms(payoff_matrix, max_memo=1000000, max_states=None, use_symmetry=True):
+    """
+    Lists every reduced form of a game under iterated weak dominance.
+
+    Parameters:
+    - payoff_matrix (PayoffMatrix): Game to reduce.
+    - max_memo (int): Maximum number of subgames in the memo table.
+    - max_states (int, optional): Stop after expanding this many subgames.
+    - use_symmetry (bool): See IEWDSExplorer.
+
+    Returns:
+    - tuple: (forms, stats). forms is a list of (p1_strategies, p2_strategies,
+      number of elimination orders) sorted by decreasing number of orders, or
+      None if max_states was reached. stats counts the expanded subgames, memo
+      hits and evictions.
+    """
+    explorer = IEWDSExplorer(payoff_matrix, max_memo, use_symmetry)
+    forms = explorer.explore(max_states=max_states)
+    if forms is None:
+        return None, explorer.stats
+    forms = sorted(((*explorer.strategies(state), n) for state, n in forms.items()),
+                   key=lambda form: (-form[2], len(form[0]) + len(form[1])))
+    return forms, explorer.stats
+
+
+if __name__ == "__main__":
+    from src.create_game import create_game
+
+    parser = argparse.ArgumentParser(description="List the reduced forms of a tie-sharing game under "
+                                                 "iterated weak dominance, over all elimination orders.")
+    parser.add_argument("R", type=int, help="Investment budget of the game.")
+    parser.add_argument("M_A", type=int, help="Maximum investment of player A.")
+    parser.add_argument("M_B", type=int, help="Maximum investment of player B.")
+    parser.add_argument("--max-memo", type=int, default=1000000, help="Maximum number of memoized subgames.")
+    parser.add_argument("--max-states", type=int, default=None, help="Stop after expanding this many subgames.")
+    parser.add_argument("--no-symmetry", action="store_true", help="Do not share memo entries of mirrored subgames.")
+    args = parser.parse_args()
+
+    game = create_game(args.R, args.M_A, args.M_B)
+    forms, stats = reduced_forms(game, args.max_memo, args.max_states, not args.no_symmetry)
+    if forms is None:
+        print(f"Stopped after expanding {args.max_states} subgames.")
+    else:
+        total = sum(n for _, _, n in forms)
+        print(f"{len(forms)} reduced form(s) over {total} elimination orders:")
+        for p1_strategies, p2_strategies, n in forms:
+            print(f"  ({p1_strategies}, {p2_strategies}): {n} orders")
+    print(f"Expanded {stats['expanded']} subgames, {stats['memo_hits']} memo hits, {stats['evictions']} evictions.")
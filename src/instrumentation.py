@@ -0,0 +1,171 @@
+import contextlib
+import cProfile
+import json
+import pstats
+import sys
+import time
+
+# the active Instrumentation, None when instrumentation is disabled
+_active = None
+
+# returned by stage() and game() while disabled, so call sites cost one function call
+_DISABLED = contextlib.nullcontext()
+
+
+class Instrumentation:
+    """
+    Wall time per stage and event counters of a sweep or a solver run.
+
+    Stage times are inclusive: a stage entered inside another stage is also
+    counted in the outer one. With per_game set, every game wrapped in game()
+    additionally gets a record with its own time and counter increments.
+
+    Parameters:
+    - per_game (bool): Whether to keep per-game records.
+    """
+
+    def __init__(self, per_game=False):
+        self.per_game = per_game
+        self.stages = {}
+        self.counters = {}
+        self.games = []
+
+    def add_time(self, name, seconds, calls=1):
+        totals = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        totals["seconds"] += seconds
+        totals["calls"] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, data):
+        """Adds the stages, counters and games of another instrumentation, as returned by to_dict."""
+        for name, totals in data["stages"].items():
+            self.add_time(name, totals["seconds"], totals["calls"])
+        for name, n in data["counters"].items():
+            self.count(name, n)
+        self.games.extend(data["games"])
+
+    def to_dict(self):
+        return {"stages": self.stages, "counters": self.counters, "games": self.games}
+
+    def save(self, path):
+        """Writes the aggregated stages and counters, and the per-game records if kept, to a JSON file."""
+        data = self.to_dict()
+        if not self.per_game:
+            del data["games"]
+        with open(path, "w") as json_file:
+            json.dump(data, json_file, indent=2)
+
+    def summary(self):
+        """Returns the stages sorted by time and the counters as printable lines."""
+        lines = [f"{name:<28} {totals['seconds']:10.4f} s {totals['calls']:10d} calls"
+                 for name, totals in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])]
+        lines += [f"{name:<28} {n:12d}" for name, n in sorted(self.counters.items())]
+        return "\n".join(lines)
+
+
+class _Stage:
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.start)
+
+
+class _GameRecord:
+    __slots__ = ("instrumentation", "key", "start", "counters")
+
+    def __init__(self, instrumentation, key):
+        self.instrumentation = instrumentation
+        self.key = key
+
+    def __enter__(self):
+        self.counters = dict(self.instrumentation.counters)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        counters = {name: n - self.counters.get(name, 0) for name, n in self.instrumentation.counters.items()
+                    if n != self.counters.get(name, 0)}
+        self.instrumentation.games.append({"game": list(self.key), "seconds": seconds, "counters": counters})
+
+
+def active():
+    """Returns the active Instrumentation, or None if instrumentation is disabled."""
+    return _active
+
+
+def enable(per_game=False):
+    """Starts collecting into a new Instrumentation and returns it."""
+    global _active
+    _active = Instrumentation(per_game)
+    return _active
+
+
+def disable():
+    """Stops collecting and returns the Instrumentation that was active, if any."""
+    global _active
+    instrumentation, _active = _active, None
+    return instrumentation
+
+
+@contextlib.contextmanager
+def collect(per_game=False):
+    """Collects into a new Instrumentation within a with block, then restores the previous state."""
+    global _active
+    previous = _active
+    try:
+        yield enable(per_game)
+    finally:
+        _active = previous
+
+
+def stage(name):
+    """Returns a context manager adding its wall time to the given stage."""
+    if _active is None:
+        return _DISABLED
+    return _Stage(_active, name)
+
+
+def count(name, n=1):
+    """Adds n to an event counter."""
+    if _active is not None:
+        _active.count(name, n)
+
+
+def game(key):
+    """Returns a context manager recording the time and counter increments of one game, if per-game records are kept."""
+    if _active is None or not _active.per_game:
+        return _DISABLED
+    return _GameRecord(_active, key)
+
+
+def profile(func, *args, sort="cumulative", limit=30, output=None, stream=None, **kwargs):
+    """
+    Runs a function under cProfile and prints its statistics.
+
+    Parameters:
+    - func (callable): Function to profile, e.g. src.sweep.evaluate_games.
+    - sort (str): pstats sort key of the printed statistics.
+    - limit (int): Number of printed functions.
+    - output (str, optional): File to dump the raw profile to, for pstats or snakeviz.
+    - stream (file, optional): Where to print the statistics, defaults to stdout.
+
+    Returns:
+    - The return value of func.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    if output is not None:
+        profiler.dump_stats(output)
+    pstats.Stats(profiler, stream=stream or sys.stdout).sort_stats(sort).print_stats(limit)
+    return result
@@ -0,0 +1,342 @@
+import argparse
+from bisect import bisect_left
+from functools import reduce
+from itertools import combinations, product
+from math import comb, gcd, prod
+import numpy as np
+
+from src.create_game import create_game
+from src.psne import IESDS
+
+
+class TieSharingGame:
+    """
+    Tie-sharing game of k players whose payoffs are evaluated on demand.
+
+    Every player invests up to their maximum; the prize R goes to the highest
+    investment and is split equally among all players tied at it, and every
+    player pays their investment. The payoff tensor has (M + 1)^k * k entries,
+    so it is never built. Instead, the payoff of a player only depends on their
+    own investment c and on the opponent type (m, t): the highest investment m
+    among the other players and the number t of them investing exactly m.
+
+        c > m:  R - c        c == m:  R / (t + 1) - c        c < m:  -c
+
+    Dominance and best response queries work on these types in closed form,
+    and players with the same strategy sets share their dominance results.
+
+    Payoffs are exact integers in units of 1 / scale, where scale is the
+    smallest integer making R / t integral for all t <= k. For two players
+    this is the scale of create_game.
+
+    Parameters:
+    - R (int): Prize shared by the highest investors.
+    - M (list): Maximum investment of every player.
+    """
+
+    def __init__(self, R, M):
+        if not float(R).is_integer():
+            raise ValueError('R must be an integer, got {}'.format(R))
+        if len(M) < 2:
+            raise ValueError('a tie-sharing game needs at least 2 players, got {}'.format(len(M)))
+        self.R = int(R)
+        self.M = [int(M_i) for M_i in M]
+        self.k = len(M)
+        # least common multiple of 1..k; math.lcm does not exist before Python 3.9
+        divisors = reduce(lambda a, b: a * b // gcd(a, b), range(1, self.k + 1))
+        self.scale = divisors // gcd(divisors, self.R)
+        # the scale grows quickly with k, beyond int64 payoffs are kept as exact python integers
+        self.dtype = np.int64 if self.scale * (abs(self.R) + max(self.M)) < 2 ** 62 else object
+        # surviving strategies of every player, reduced by iesds
+        self.strategies = [tuple(range(M_i + 1)) for M_i in self.M]
+        self._dominance_cache = {}
+
+    def scaled_payoff(self, c, m, t):
+        """
+        Returns the scaled payoffs of investments c against opponent types (m, t), broadcast as numpy arrays.
+        """
+        c, m, t = (np.asarray(v, dtype=self.dtype) for v in (c, m, t))
+        prize = np.full(np.broadcast(c, m, t).shape, self.scale * self.R, dtype=self.dtype)
+        return np.where(c > m, prize, np.where(c == m, prize // (t + 1), 0 * prize)) - self.scale * c
+
+    def opponent_type(self, player, profile):
+        """Returns the opponent type (m, t) of a player in a profile of investments of all players."""
+        others = [c for j, c in enumerate(profile) if j != player]
+        m = max(others)
+        return m, others.count(m)
+
+    def __getitem__(self, profile):
+        # payoffs of all players in a profile of investments, e.g. game[3, 0, 5]
+        if len(profile) != self.k:
+            raise ValueError('expected a profile of {} investments, got {}'.format(self.k, len(profile)))
+        scaled = [int(self.scaled_payoff(c, *self.opponent_type(i, profile))) for i, c in enumerate(profile)]
+        return np.array(scaled) / self.scale
+
+    @staticmethod
+    def opponent_types(opponent_strategies):
+        """
+        Returns the opponent types that occur when the opponents play from the given strategy sets.
+
+        A type (m, t) occurs if every opponent can invest at most m and exactly
+        t of them can invest m while all others invest less. For every m, the
+        t that occur form a range.
+
+        Parameters:
+        - opponent_strategies (list): Strategy sets of the opponents.
+
+        Returns:
+        - tuple: (m, t_min, t_max) integer arrays, with the m that occur in increasing order.
+        """
+        values = np.array(sorted(set().union(*opponent_strategies)), dtype=np.int64)
+        # can_tie[j, v]: opponent j can invest values[v], can_lose[j, v]: opponent j can invest less
+        can_tie = np.array([np.isin(values, strategies) for strategies in opponent_strategies])
+        can_lose = np.array([min(strategies) for strategies in opponent_strategies])[:, None] < values[None, :]
+        occurs = (can_tie | can_lose).all(axis=0)
+        # opponents that cannot invest less than m are at m, the others that can invest m may be
+        forced = (can_tie & ~can_lose).sum(axis=0)[occurs]
+        optional = (can_tie & can_lose).sum(axis=0)[occurs]
+        return values[occurs], np.maximum(1, forced), forced + optional
+
+    def dominance(self, player, mode='strict'):
+        """
+        Tells which strategies of a player are dominated by which, without evaluating any payoff tensor.
+
+        Against a type (m, t), an investment c wins (R - c) if c > m, ties
+        (R / (t + 1) - c) if c == m and loses (-c) otherwise. For two
+        investments a and b, the m that occur fall into at most five regions:
+        below both, equal to a, between them, equal to b and above both. The
+        difference of their payoffs is constant within a region apart from the
+        two ties, where only the smallest and the largest t matter. Comparing
+        a and b is thus a handful of integer comparisons, ties are multiplied
+        out by t + 1 instead of scaling the payoffs.
+
+        Parameters:
+        - player (int): Index of the player.
+        - mode (str): 'strict', or 'weak' for weakly but not strictly dominated strategies,
+          as for payoff_matrix.dominance_matrix.
+
+        Returns:
+        - np.ndarray: Boolean matrix, entry [i, j] tells whether the player's
+          i-th surviving strategy is dominated by the j-th.
+        """
+        R = self.R
+        own = np.array(self.strategies[player], dtype=np.int64)
+        ms, t_min, t_max = self.opponent_types([s for j, s in enumerate(self.strategies) if j != player])
+        a, b = own[:, None], own[None, :]
+        low, high = np.minimum(a, b), np.maximum(a, b)
+
+        # payoff of b minus payoff of a in every region, with its worst and best case over the t that occur;
+        # below and above both investments, both win or both lose
+        occurs = [np.searchsorted(ms, low, 'left') > 0, np.searchsorted(ms, high, 'right') < len(ms)]
+        worst = [a - b, a - b]
+        # in between, the higher investment wins
+        occurs.append(np.searchsorted(ms, high, 'left') > np.searchsorted(ms, low, 'right'))
+        worst.append(np.where(b > a, R - b + a, a - b - R))
+        best = worst[:]
+
+        # ties at m = a and at m = b, as the payoff difference times t + 1
+        position = np.minimum(np.searchsorted(ms, own), len(ms) - 1)
+        tie_occurs = ms[position] == own
+        tie_min, tie_max = t_min[position], t_max[position]
+        b_payoff = np.where(b > a, R - b, -b)
+        occurs.append(tie_occurs[:, None] & (a != b))
+        worst.append((b_payoff + a) * (tie_min[:, None] + 1) - R)
+        best.append((b_payoff + a) * (tie_max[:, None] + 1) - R)
+        a_payoff = np.where(a > b, R - a, -a)
+        occurs.append(tie_occurs[None, :] & (a != b))
+        worst.append(R - (b + a_payoff) * (tie_max[None, :] + 1))
+        best.append(R - (b + a_payoff) * (tie_min[None, :] + 1))
+
+        strictly = a != b
+        weakly = a != b
+        somewhere_better = np.zeros_like(strictly)
+        for region_occurs, region_worst, region_best in zip(occurs, worst, best):
+            strictly &= ~region_occurs | (region_worst > 0)
+            weakly &= ~region_occurs | (region_worst >= 0)
+            somewhere_better |= region_occurs & (region_best > 0)
+        if mode == 'strict':
+            return strictly
+        return ~strictly & weakly & somewhere_better
+
+    def dominated_strategies(self, player, mode='strict'):
+        """
+        Maps the strictly (or weakly) dominated strategies of a player to the first strategy dominating them.
+
+        Results are cached per strategy set and multiset of opponent strategy
+        sets, which lets symmetric players share them.
+        """
+        others = tuple(sorted(s for j, s in enumerate(self.strategies) if j != player))
+        key = (self.strategies[player], others, mode)
+        dominated = self._dominance_cache.get(key)
+        if dominated is None:
+            is_dominated_by = self.dominance(player, mode)
+            own = self.strategies[player]
+            dominated = {own[i]: own[is_dominated_by[i].argmax()] for i in np.flatnonzero(is_dominated_by.any(axis=1))}
+            self._dominance_cache[key] = dominated
+        return dominated
+
+    def iesds(self):
+        """
+        Iteratively eliminates the strictly dominated strategies of all players.
+
+        The dominated strategies of all players are removed at once in every
+        round, which gives the same reduced game as removing them one by one
+        in any order.
+
+        Returns:
+        - list: The surviving strategies of every player.
+        """
+        while True:
+            # all players' dominated strategies of a round are found before any is removed, so symmetric
+            # players face the same opponents and share one dominance computation
+            dominated = [self.dominated_strategies(player) for player in range(self.k)]
+            if not any(dominated):
+                break
+            self.strategies = [tuple(s for s in strategies if s not in player_dominated)
+                               for strategies, player_dominated in zip(self.strategies, dominated)]
+        return [list(s) for s in self.strategies]
+
+    def best_responses(self, player, profile):
+        """
+        Returns the player's best responses among their surviving strategies to the other players' investments.
+
+        Only three investments can be best: the smallest one beating the
+        highest opponent investment, tying with it, or the smallest one.
+
+        Parameters:
+        - player (int): Index of the player.
+        - profile (sequence): Investments of all players, the player's own entry is ignored.
+        """
+        m, t = self.opponent_type(player, profile)
+        own = self.strategies[player]
+        # strategies are sorted, own[position] is the smallest investment of at least m
+        position = bisect_left(own, m)
+        candidates = {own[0]}
+        candidates.update(own[position:position + 2] if position < len(own) and own[position] == m
+                          else own[position:position + 1])
+        candidates = sorted(candidates)
+        payoffs = self.scaled_payoff(candidates, m, t)
+        return [c for c, payoff in zip(candidates, payoffs) if payoff == payoffs.max()]
+
+    def pure_nash_equilibria(self, expand=True):
+        """
+        Returns the pure strategy Nash equilibria among the surviving strategies.
+
+        In an equilibrium, every player below the highest investment m invests
+        their smallest strategy, anything more loses more. Players with the
+        same strategy set are interchangeable, so a candidate is given by m and
+        the number of players of every such group investing m, and one
+        representative profile per candidate is checked instead of the
+        (M + 1)^k profiles.
+
+        Parameters:
+        - expand (bool): Whether to list every equilibrium, or only one
+          representative per candidate with the number of equilibria it
+          stands for, which can be exponential in k.
+
+        Returns:
+        - list: Equilibrium profiles as tuples of investments, sorted; without
+          expand, (representative profile, number of equilibria) tuples.
+        """
+        groups = {}
+        for player, strategies in enumerate(self.strategies):
+            groups.setdefault(strategies, []).append(player)
+        groups = [(set(strategies), strategies[0], players) for strategies, players in groups.items()]
+
+        equilibria = []
+        for m in sorted(set().union(*self.strategies)):
+            # possible numbers of players of every group investing m, the others invest their smallest strategy
+            count_ranges = []
+            for strategies, lowest, players in groups:
+                if lowest > m or (lowest == m and m not in strategies):
+                    break
+                if lowest == m:
+                    count_ranges.append([len(players)])
+                else:
+                    count_ranges.append(range(len(players) + 1) if m in strategies else [0])
+            else:
+                for counts in product(*count_ranges):
+                    if sum(counts) == 0:
+                        continue
+                    profile = [None] * self.k
+                    for (_, lowest, players), count in zip(groups, counts):
+                        for n, player in enumerate(players):
+                            profile[player] = m if n < count else lowest
+                    # players of a group at the same investment have the same best responses
+                    checked = [players[n] for (_, _, players), count in zip(groups, counts)
+                               for n in {0, count} if n < len(players)]
+                    if not all(profile[j] in self.best_responses(j, profile) for j in checked):
+                        continue
+                    if expand:
+                        equilibria.extend(self._permutations(groups, counts, m))
+                    else:
+                        equilibria.append((tuple(profile), prod(comb(len(players), count)
+                                                                for (_, _, players), count in zip(groups, counts))))
+        return sorted(equilibria)
+
+    def _permutations(self, groups, counts, m):
+        # all profiles where count players of every group invest m and the others their smallest strategy
+        choices = [combinations(players, count) for (_, _, players), count in zip(groups, counts)]
+        for chosen in product(*choices):
+            at_max = set().union(*chosen)
+            yield tuple(m if j in at_max else self.strategies[j][0] for j in range(self.k))
+
+    def solve(self):
+        """
+        Runs IESDS and finds the pure strategy Nash equilibria of the reduced game.
+
+        Returns:
+        - tuple: (surviving strategies of every player, equilibria).
+        """
+        return self.iesds(), self.pure_nash_equilibria()
+
+    def to_payoff_matrix(self):
+        """
+        Returns the two-player game as a PayoffMatrix, identical to create_game(R, M_A, M_B).
+        """
+        if self.k != 2:
+            raise ValueError('only two-player games have a payoff matrix, this game has {} players'.format(self.k))
+        return create_game(self.R, *self.M)
+
+
+def verify_two_player(max_R=12, max_M=15):
+    """
+    Compares TieSharingGame.solve with IESDS on create_game for every game
+    with 1 <= R < max_R and 1 <= M_A, M_B < max_M.
+
+    Returns:
+    - list: The (R, M_A, M_B) of all games where the surviving strategies or the equilibria differ.
+    """
+    mismatches = []
+    for R in range(1, max_R):
+        for M_A in range(1, max_M):
+            for M_B in range(1, max_M):
+                game_instance = create_game(R, M_A, M_B)
+                equilibrium_results, _ = IESDS(game_instance, show_steps=False)
+                full = (
+                    [sorted(int(s) for s in game_instance.p1_strategies),
+                     sorted(int(s) for s in game_instance.p2_strategies)],
+                    [(int(eq[0]), int(eq[1])) for eq in equilibrium_results]
+                )
+                if TieSharingGame(R, [M_A, M_B]).solve() != full:
+                    mismatches.append((R, M_A, M_B))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a k-player tie-sharing game by IESDS and list its pure "
+                                                 "strategy Nash equilibria.")
+    parser.add_argument("R", type=int, help="Prize shared by the highest investors.")
+    parser.add_argument("M", type=int, nargs="+", help="Maximum investment of every player.")
+    parser.add_argument("--count", action="store_true",
+                        help="Print one representative per group of equivalent equilibria with their number.")
+    args = parser.parse_args()
+
+    game = TieSharingGame(args.R, args.M)
+    surviving = game.iesds()
+    for player, strategies in enumerate(surviving):
+        print(f"Player {player + 1} surviving strategies: {strategies}")
+    equilibria = game.pure_nash_equilibria(expand=not args.count)
+    print(f"{len(equilibria)} pure strategy Nash equilibri{'um' if len(equilibria) == 1 else 'a'}:")
+    for equilibrium in equilibria:
+        print(f"  {equilibrium}")
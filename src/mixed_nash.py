@@ -0,0 +1,321 @@
+import argparse
+import time
+from itertools import combinations
+from math import comb
+import numpy as np
+
+from src.payoff_matrix import PayoffMatrix, DOMINANCE_BLOCK_ELEMENTS
+from src.canonical import canonical_game
+from src.create_game import create_game
+from src.psne import IESDS
+
+# tolerance of the equilibrium conditions, on payoffs normalized to [0, 1]
+TOLERANCE = 1e-9
+# default number of (row support, column support) pairs per game checked by support enumeration,
+# enough to enumerate all supports of reduced games up to 8x8
+MAX_CANDIDATES = 20000
+# equilibria whose mixed strategies differ by less than this in every probability are the same
+DUPLICATE_TOLERANCE = 1e-6
+# games with a single mixed equilibrium that support enumeration and many Lemke-Howson paths all find
+UNIQUE_EQUILIBRIUM_GAMES = ((12, 12, 13), (40, 50, 60))
+
+
+def _normalized(payoffs):
+    # payoffs of a stack of games scaled to [0, 1] per game and player, which leaves the equilibria unchanged
+    payoffs = payoffs.astype(float)
+    low = payoffs.min(axis=(1, 2), keepdims=True)
+    spread = payoffs.max(axis=(1, 2), keepdims=True) - low
+    return (payoffs - low) / np.where(spread > 0, spread, 1)
+
+
+def _indifference_solve(matrices):
+    # solves [[M, -1], [1, 0]] [z; w] = [0; 1] for a stack of k x k matrices M: the mixture z over the
+    # columns of M that makes all its rows pay w. Returns (z, w, solvable)
+    n_systems, k = matrices.shape[:2]
+    systems = np.zeros((n_systems, k + 1, k + 1))
+    systems[:, :k, :k] = matrices
+    systems[:, :k, k] = -1
+    systems[:, k, :k] = 1
+    solvable = np.abs(np.linalg.det(systems)) > TOLERANCE
+    solution = np.zeros((n_systems, k + 1))
+    if solvable.any():
+        rhs = np.zeros((int(solvable.sum()), k + 1, 1))
+        rhs[:, k] = 1
+        solution[solvable] = np.linalg.solve(systems[solvable], rhs)[:, :, 0]
+    return solution[:, :k], solution[:, k], solvable
+
+
+def support_enumeration(payoffs, support_sizes):
+    """
+    Finds the equilibria of a stack of equally sized games with supports of equal size.
+
+    All (game, row support, column support) candidates of a support size are
+    checked at once: for each, the mixture of each player making the opponent
+    indifferent on the opponent's support is solved for, and kept if it is a
+    probability vector and no strategy outside the support pays more. In
+    degenerate games, equilibria whose supports differ in size can be missed.
+
+    Parameters:
+    - payoffs (np.ndarray): Array of shape (n_games, rows, cols, 2).
+    - support_sizes (iterable): Support sizes to enumerate.
+
+    Returns:
+    - list: For each game, a list of (x, y) mixed strategy arrays.
+    """
+    n_games, n, m = payoffs.shape[:3]
+    A = _normalized(payoffs[..., 0])
+    B = _normalized(payoffs[..., 1])
+    equilibria = [[] for _ in range(n_games)]
+    for k in support_sizes:
+        row_supports = np.array(list(combinations(range(n), k)))
+        col_supports = np.array(list(combinations(range(m), k)))
+        # candidates are enumerated in blocks whose arrays fit into DOMINANCE_BLOCK_ELEMENTS
+        candidates_per_game = len(row_supports) * len(col_supports)
+        block_size = max(1, DOMINANCE_BLOCK_ELEMENTS // (2 * (k + 1) ** 2 + k * (n + m)))
+        for start in range(0, n_games * candidates_per_game, block_size):
+            candidates = np.arange(start, min(start + block_size, n_games * candidates_per_game))
+            game, pair = np.divmod(candidates, candidates_per_game)
+            I = row_supports[pair // len(col_supports)]
+            J = col_supports[pair % len(col_supports)]
+            # player 2's mixture y on J makes player 1 indifferent on I, where no other row may pay more
+            y, u, valid = _indifference_solve(A[game[:, None, None], I[:, :, None], J[:, None, :]])
+            valid &= (y >= -TOLERANCE).all(axis=1)
+            p1_payoffs = np.einsum('pki,pk->pi', A[game[:, None], :, J], y)
+            valid &= (p1_payoffs <= u[:, None] + TOLERANCE).all(axis=1)
+            # the same for player 1's mixture x on I, only for the candidates left
+            game, I, J, y = game[valid], I[valid], J[valid], y[valid]
+            x, v, valid = _indifference_solve(np.swapaxes(B[game[:, None, None], I[:, :, None], J[:, None, :]], 1, 2))
+            valid &= (x >= -TOLERANCE).all(axis=1)
+            p2_payoffs = np.einsum('pk,pkj->pj', x, B[game[:, None], I, :])
+            valid &= (p2_payoffs <= v[:, None] + TOLERANCE).all(axis=1)
+            for p in np.flatnonzero(valid):
+                full_x, full_y = np.zeros(n), np.zeros(m)
+                full_x[I[p]] = np.clip(x[p], 0, None)
+                full_y[J[p]] = np.clip(y[p], 0, None)
+                equilibria[game[p]].append((full_x / full_x.sum(), full_y / full_y.sum()))
+    return equilibria
+
+
+def _pivot(tableau, basis, column, identity):
+    # enters the variable of a column into the basis, choosing the leaving row by the lexicographic
+    # minimum ratio rule over the right hand side and the columns of the initial basis, which keeps
+    # the path from cycling in degenerate games. Returns the label of the leaving variable
+    rows = np.flatnonzero(tableau[:, column] > TOLERANCE)
+    ratios = tableau[rows][:, [-1] + identity] / tableau[rows, column][:, None]
+    for position in range(ratios.shape[1]):
+        ties = ratios[:, position] <= ratios[:, position].min() + TOLERANCE
+        rows, ratios = rows[ties], ratios[ties]
+        if len(rows) == 1:
+            break
+    row = rows[0]
+    tableau[row] /= tableau[row, column]
+    others = np.arange(len(tableau)) != row
+    tableau[others] -= tableau[others, column][:, None] * tableau[row]
+    leaving, basis[row] = basis[row], column
+    return leaving
+
+
+def lemke_howson(payoffs, initial_label=0, max_pivots=None):
+    """
+    Finds one equilibrium of a game by the Lemke-Howson algorithm.
+
+    Strategies of player 1 have labels 0 to rows - 1 and those of player 2
+    rows to rows + cols - 1. Starting from the artificial equilibrium (0, 0),
+    the initial label is dropped and the path of almost completely labeled
+    vertex pairs is followed to an equilibrium. Different initial labels can
+    lead to different equilibria.
+
+    Parameters:
+    - payoffs (np.ndarray): Array of shape (rows, cols, 2).
+    - initial_label (int): Label dropped first.
+    - max_pivots (int, optional): Maximum path length, by default a generous multiple of the game size.
+
+    Returns:
+    - tuple: (x, y) mixed strategy arrays.
+    """
+    n, m = payoffs.shape[:2]
+    # shift all payoffs to be positive, so both best response polytopes are bounded
+    A = _normalized(payoffs[None, :, :, 0])[0] + 1
+    B = _normalized(payoffs[None, :, :, 1])[0] + 1
+    # columns of both tableaus are the variables by label, followed by the right hand side:
+    # x_i and the slacks s_i of player 1's best response conditions have label i,
+    # the slacks r_j of player 2's conditions and y_j have label n + j
+    p1_tableau = np.hstack([B.T, np.eye(m), np.ones((m, 1))])
+    p2_tableau = np.hstack([np.eye(n), A, np.ones((n, 1))])
+    p1_basis = list(range(n, n + m))
+    p2_basis = list(range(n))
+    tableaus = {1: (p1_tableau, p1_basis, list(range(n, n + m))), 2: (p2_tableau, p2_basis, list(range(n)))}
+
+    if max_pivots is None:
+        max_pivots = 100 * (n + m) ** 2
+    label = initial_label
+    # x_i of a dropped label i < n enters player 1's tableau, y_j of a label n + j enters player 2's
+    player = 1 if initial_label < n else 2
+    for _ in range(max_pivots):
+        tableau, basis, identity = tableaus[player]
+        label = _pivot(tableau, basis, label, identity)
+        if label == initial_label:
+            break
+        player = 3 - player
+    else:
+        raise RuntimeError('Lemke-Howson did not converge within {} pivots'.format(max_pivots))
+
+    x, y = np.zeros(n), np.zeros(m)
+    for row, variable in enumerate(p1_basis):
+        if variable < n:
+            x[variable] = p1_tableau[row, -1]
+    for row, variable in enumerate(p2_basis):
+        if variable >= n:
+            y[variable - n] = p2_tableau[row, -1]
+    return x / x.sum(), y / y.sum()
+
+
+def _initial_labels(n, m):
+    # labels of player 1 and player 2 in turn, so a few paths start from both sides
+    labels = [label for pair in zip(range(n), range(n, n + m)) for label in pair]
+    return labels + list(range(min(n, m), n)) + list(range(n + min(n, m), n + m))
+
+
+def _add_unique(equilibria, x, y):
+    # keeps (x, y) unless an equilibrium within DUPLICATE_TOLERANCE of it is kept already, as support
+    # enumeration and every Lemke-Howson path find the same equilibrium with different rounding errors
+    for kept_x, kept_y in equilibria:
+        if np.allclose(kept_x, x, rtol=0, atol=DUPLICATE_TOLERANCE) \
+                and np.allclose(kept_y, y, rtol=0, atol=DUPLICATE_TOLERANCE):
+            return
+    equilibria.append((x, y))
+
+
+def mixed_equilibria_batch(games, max_candidates=MAX_CANDIDATES, paths=None):
+    """
+    Finds mixed strategy Nash equilibria of many games.
+
+    Games of the same size are stacked and solved together by support
+    enumeration, over the support sizes whose candidate count stays within
+    max_candidates per game. If that leaves support sizes out, or finds
+    nothing, which can happen in degenerate games, Lemke-Howson paths are
+    followed from the initial labels of both players in turn. Run IESDS first: strictly dominated strategies are
+    never played in an equilibrium, and the reduced games are much smaller.
+
+    Parameters:
+    - games (list): List of PayoffMatrix objects.
+    - max_candidates (int): Maximum number of support pairs per game checked by support enumeration.
+    - paths (int, optional): Number of Lemke-Howson paths per game, by default one per label.
+
+    Returns:
+    - list: For each game, a list of equilibria (p1_mix, p2_mix, (p1_payoff, p2_payoff)),
+      where the mixes map the strategy names that are played to their probabilities.
+    """
+    results = [None] * len(games)
+    by_shape = {}
+    for k, game in enumerate(games):
+        by_shape.setdefault(game.payoffs.shape[:2], []).append(k)
+    for (n, m), indices in by_shape.items():
+        # the largest support sizes within the candidate budget
+        support_sizes, total = [], 0
+        for size in range(1, min(n, m) + 1):
+            total += comb(n, size) * comb(m, size)
+            if total > max_candidates:
+                break
+            support_sizes.append(size)
+        complete = len(support_sizes) == min(n, m)
+        found = support_enumeration(np.stack([games[k].payoffs for k in indices]), support_sizes)
+        for k, game_equilibria in zip(indices, found):
+            game = games[k]
+            equilibria = []
+            for x, y in game_equilibria:
+                _add_unique(equilibria, x, y)
+            if not complete or not equilibria:
+                for label in _initial_labels(n, m)[:paths]:
+                    _add_unique(equilibria, *lemke_howson(game.payoffs, label))
+            results[k] = [_describe(game, x, y) for x, y in equilibria]
+    return results
+
+
+def _describe(game, x, y):
+    # mixes by strategy name and the expected payoffs in the original units
+    payoffs = game.actual_payoffs().astype(float)
+    p1_mix = {game.p1_strategies[i]: float(x[i]) for i in np.flatnonzero(x > TOLERANCE)}
+    p2_mix = {game.p2_strategies[j]: float(y[j]) for j in np.flatnonzero(y > TOLERANCE)}
+    return p1_mix, p2_mix, (float(x @ payoffs[:, :, 0] @ y), float(x @ payoffs[:, :, 1] @ y))
+
+
+def mixed_equilibria(payoff_matrix, max_candidates=MAX_CANDIDATES, paths=None):
+    """Finds mixed strategy Nash equilibria of one game, see mixed_equilibria_batch."""
+    return mixed_equilibria_batch([payoff_matrix], max_candidates, paths)[0]
+
+
+def reduced_game(R, M_A, M_B):
+    """
+    Returns the reduced form left by IESDS of a tie-sharing game.
+
+    Only the canonical game is created and reduced, see src.canonical, which
+    keeps this cheap for large maximum investments.
+    """
+    key, swapped = canonical_game(R, M_A, M_B)
+    game = create_game(*key)
+    IESDS(game, show_steps=False, batched=True)
+    if swapped:
+        game = PayoffMatrix(payoffs=game.payoffs.transpose(1, 0, 2)[:, :, ::-1], p1_strategies=game.p2_strategies,
+                            p2_strategies=game.p1_strategies, copy_payoffs=False, scale=game.scale)
+    return game
+
+
+def solve_mixed(games, max_candidates=MAX_CANDIDATES, paths=None):
+    """
+    Finds mixed strategy Nash equilibria of tie-sharing games on their reduced forms.
+
+    Parameters:
+    - games (iterable): (R, M_A, M_B) tuples.
+    - max_candidates (int): See mixed_equilibria_batch.
+    - paths (int, optional): See mixed_equilibria_batch.
+
+    Returns:
+    - list: For each game, its equilibria as returned by mixed_equilibria_batch.
+    """
+    return mixed_equilibria_batch([reduced_game(*game) for game in games], max_candidates, paths)
+
+
+def verify_unique_equilibria(games=UNIQUE_EQUILIBRIUM_GAMES, max_candidates=MAX_CANDIDATES, paths=None):
+    """
+    Checks that games with a single mixed equilibrium report it exactly once,
+    however many times the solvers find it.
+
+    Returns:
+    - list: The (R, M_A, M_B) of all games that do not have exactly one equilibrium.
+    """
+    return [game for game, equilibria in zip(games, solve_mixed(games, max_candidates, paths))
+            if len(equilibria) != 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find mixed strategy Nash equilibria of tie-sharing games.")
+    parser.add_argument("game", type=int, nargs="*", metavar="R M_A M_B",
+                        help="Game to solve; without one, all games of the grid without a pure equilibrium are solved.")
+    parser.add_argument("--max-R", type=int, default=10, help="Grid games have 1 <= R < max_R.")
+    parser.add_argument("--max-M", type=int, default=10, help="Grid games have 1 <= M_A <= M_B < max_M.")
+    parser.add_argument("--max-candidates", type=int, default=MAX_CANDIDATES,
+                        help="Support pairs per game checked by support enumeration before using Lemke-Howson.")
+    parser.add_argument("--paths", type=int, default=None,
+                        help="Lemke-Howson paths per game, by default one per strategy of both players.")
+    args = parser.parse_args()
+
+    if args.game:
+        if len(args.game) != 3:
+            parser.error("a game is given as R M_A M_B")
+        for p1_mix, p2_mix, payoffs in solve_mixed([tuple(args.game)], args.max_candidates, args.paths)[0]:
+            print(f"A: {p1_mix}\nB: {p2_mix}\npayoffs: {payoffs}\n")
+    else:
+        start = time.perf_counter()
+        grid = [(R, M_A, M_B) for R in range(1, args.max_R) for M_A in range(1, args.max_M)
+                for M_B in range(M_A, args.max_M)]
+        reduced = [reduced_game(*game) for game in grid]
+        # only games without a pure equilibrium need mixed strategies
+        mixed_only = [k for k, game in enumerate(reduced)
+                      if not np.logical_and(*game.best_response_masks()).any()]
+        results = mixed_equilibria_batch([reduced[k] for k in mixed_only], args.max_candidates, args.paths)
+        for k, equilibria in zip(mixed_only, results):
+            R, M_A, M_B = grid[k]
+            supports = ", ".join(f"{len(p1_mix)}x{len(p2_mix)}" for p1_mix, p2_mix, _ in equilibria)
+            print(f"R={R} M_A={M_A} M_B={M_B}: {len(equilibria)} equilibria, supports {supports}")
+        print(f"Solved {len(mixed_only)} games without a pure equilibrium in {time.perf_counter() - start:.2f} s.")
@@ -1,68 +1,368 @@
-import pandas as pd
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# Load the CSV file
-csv_path =  "/Users/filipberntsson/Documents/Studies/Courses/game_theory_and_rationality/Project/BestVersion/results_all_sorted.csv" # Replace with the actual path to your CSV
-data = pd.read_csv(csv_path)
-
-# Extract unique values of R
-unique_R = sorted(data["R"].unique())
-num_plots = len(unique_R)
-
-# Initialize the plot index
-current_plot_index = 0
-
-# Function to create the heatmap for a given index
-def plot_heatmap(index):
-    global current_plot_index
-
-    # Clamp the index to stay within bounds
-    current_plot_index = max(0, min(index, num_plots - 1))
-
-    # Clear the current plot
-    plt.clf()
-
-    # Get the current R
-    r = unique_R[current_plot_index]
-
-    # Filter data for the current R
-    subset = data[data["R"] == r]
-
-    # Create a pivot table for the heatmap
-    heatmap_data = subset.pivot_table(
-        index="M_A",
-        columns="M_B",
-        values="NumPureNashEquilibria",  # Adjust to match the column in your CSV
-        aggfunc="sum",
-        fill_value=0
-    )
-
-    # Plot the heatmap
-    sns.heatmap(heatmap_data, annot=True, fmt="d", cmap="viridis", cbar=True)
-    plt.title(f"Heatmap of Nash Equilibria Counts for R={r}")
-    plt.xlabel("M_B")
-    plt.ylabel("M_A")
-    plt.tight_layout()
-    plt.draw()  # Update the plot
-
-# Function to handle key press events
-def on_key(event):
-    global current_plot_index
-    if event.key == "right":  # Forward
-        plot_heatmap(current_plot_index + 1)
-    elif event.key == "left":  # Backward
-        plot_heatmap(current_plot_index - 1)
-
-# Set up the figure
-plt.figure(figsize=(10, 8))
-
-# Connect the key press event to the handler
-plt.gcf().canvas.mpl_connect("key_press_event", on_key)
-
-# Plot the initial heatmap
-plot_heatmap(current_plot_index)
-
-# Show the plotpip
-plt.show()
+import pandas as pd
+from src.predict_signature import SIGNATURE_RULES
+from src.predict_nash import NASH_RULES
+
+
+# result metrics that can be mapped: name -> (CSV column, Arrow column, kind, title)
+# counts are mapped as they are, correctness as 1/0 and rules as their index in SIGNATURE_RULES/NASH_RULES
+METRICS = {
+    "true_num_nash": ("TrueNumPureNash", "true_num_nash", "count", "Number of pure Nash equilibria"),
+    "predicted_num_nash": ("PredictedNumPureNash", "predicted_num_nash", "count",
+                           "Predicted number of pure Nash equilibria"),
+    "signature_correct": ("SigPredTrue?", "signature_correct", "correct", "Signature prediction correct"),
+    "num_nash_correct": ("NumPredTrue?", "num_nash_correct", "correct", "Equilibrium count prediction correct"),
+    "locations_correct": ("LocPredTrue?", "nash_locations_correct", "correct",
+                          "Equilibrium location prediction correct"),
+    "signature_rule": ("SigRuleUsed", "signature_rule", "signature_rule", "Signature rule"),
+    "nash_rule": ("NumRuleUsed", "nash_rule", "nash_rule", "Nash rule"),
+}
+DEFAULT_RESULTS = "results_all_sorted.csv"
+# slices with more cells than this are drawn without the value of every cell
+MAX_ANNOTATED_CELLS = 900
+# image formats rendered by blitting onto one Agg canvas, others are saved figure by figure
+RASTER_FORMATS = ("png", "jpg", "jpeg", "tif", "tiff", "webp")
+
+
+def load_results(results_path, metrics=tuple(METRICS)):
+    """
+    Reads the game parameters and the given metric columns of a results file.
+
+    Parameters:
+    - results_path (str): Results CSV file as written by main.py, or an Arrow IPC file written with --arrow.
+    - metrics (iterable): Names of the metrics to read, see METRICS.
+
+    Returns:
+    - dict: Maps "R", "M_A", "M_B" and every metric name to a numpy array of its values.
+    """
+    arrow = results_path.endswith(".arrow")
+    columns = {name: METRICS[name][1 if arrow else 0] for name in metrics}
+    if arrow:
+        try:
+            import pyarrow.ipc
+        except ImportError:
+            raise ImportError("Reading Arrow results requires pyarrow (pip install pyarrow)") from None
+        with pyarrow.ipc.open_file(results_path) as reader:
+            table = reader.read_all().select(["R", "M_A", "M_B"] + sorted(set(columns.values())))
+        data = {column: table.column(column).to_numpy() for column in table.column_names}
+    else:
+        # only the needed columns are parsed, the signature and location columns are the bulk of the file
+        frame = pd.read_csv(results_path, usecols=["R", "M_A", "M_B"] + sorted(set(columns.values())))
+        data = {column: frame[column].to_numpy() for column in frame.columns}
+    results = {key: data[key].astype(np.int64) for key in ("R", "M_A", "M_B")}
+    for name, column in columns.items():
+        results[name] = metric_values(data[column], METRICS[name][2])
+    return results
+
+
+def metric_values(column, kind):
+    """
+    Converts a results column to the numbers that are mapped.
+
+    Parameters:
+    - column (np.ndarray): Column values as read from the CSV or Arrow file.
+    - kind (str): "count", "correct", "signature_rule" or "nash_rule".
+    """
+    if kind == "count":
+        return column.astype(float)
+    if kind == "correct":
+        return (column == "Yes" if column.dtype.kind in "OUT" else column).astype(float)
+    rules = SIGNATURE_RULES if kind == "signature_rule" else NASH_RULES
+    rule_ids = {rule: rule_id for rule_id, rule in enumerate(rules)}
+    return np.array([rule_ids.get(rule, np.nan) for rule in column], dtype=float)
+
+
+class ResultsCube:
+    """
+    Dense (R, M_A, M_B) array of one result metric.
+
+    values[i, j, k] is the metric of the game (R_values[i], M_A_values[j],
+    M_B_values[k]), games missing from the results are NaN. The cube is built
+    once and every slice is a view into it, so rendering or browsing slices
+    does not touch the results again.
+
+    Parameters:
+    - results (dict): Results as returned by load_results.
+    - metric (str): Name of the metric, see METRICS.
+    - mirror (bool): Also fill (R, M_B, M_A) from (R, M_A, M_B) where it is
+      missing. Sweeps only write M_A <= M_B, and swapping M_A and M_B only
+      swaps the players, which leaves every metric unchanged.
+    """
+
+    def __init__(self, results, metric, mirror=False):
+        self.metric = metric
+        R, M_A, M_B = results["R"], results["M_A"], results["M_B"]
+        self.R_values, R_index = np.unique(R, return_inverse=True)
+        if mirror:
+            self.M_A_values = self.M_B_values = np.union1d(M_A, M_B)
+            M_A_index, M_B_index = np.searchsorted(self.M_A_values, M_A), np.searchsorted(self.M_B_values, M_B)
+        else:
+            self.M_A_values, M_A_index = np.unique(M_A, return_inverse=True)
+            self.M_B_values, M_B_index = np.unique(M_B, return_inverse=True)
+        self.values = np.full((len(self.R_values), len(self.M_A_values), len(self.M_B_values)), np.nan)
+        self.values[R_index, M_A_index, M_B_index] = results[metric]
+        if mirror:
+            self.values = np.where(np.isnan(self.values), self.values.transpose(0, 2, 1), self.values)
+
+    @property
+    def title(self):
+        return METRICS[self.metric][3]
+
+    @property
+    def kind(self):
+        return METRICS[self.metric][2]
+
+    def value_range(self):
+        """Returns the smallest and largest value of the cube, used as a common color scale for all slices."""
+        if np.isnan(self.values).all():
+            return 0.0, 1.0
+        return float(np.nanmin(self.values)), float(np.nanmax(self.values))
+
+    def save(self, path):
+        """Saves the cube to an .npz file, to be read with ResultsCube.load."""
+        np.savez_compressed(path, metric=self.metric, values=self.values, R_values=self.R_values,
+                            M_A_values=self.M_A_values, M_B_values=self.M_B_values)
+
+    @classmethod
+    def load(cls, path):
+        cube = cls.__new__(cls)
+        with np.load(path) as data:
+            cube.metric = str(data["metric"])
+            for key in ("values", "R_values", "M_A_values", "M_B_values"):
+                setattr(cube, key, data[key])
+        return cube
+
+
+class SliceRenderer:
+    """
+    Draws the R slices of a ResultsCube as heatmaps onto one figure.
+
+    The image, color bar and cell labels are created once; showing another
+    slice only replaces the image data and the label texts, which is what
+    makes rendering hundreds of slices fast.
+
+    Parameters:
+    - cube (ResultsCube): Cube to draw.
+    - figure (matplotlib.figure.Figure): Figure to draw on.
+    - annotate (bool, optional): Whether to write the value into every cell,
+      by default only for slices of at most MAX_ANNOTATED_CELLS cells.
+    """
+
+    def __init__(self, cube, figure, annotate=None):
+        from matplotlib import colormaps
+
+        self.cube = cube
+        self.figure = figure
+        n_rows, n_columns = cube.values.shape[1:]
+        if annotate is None:
+            annotate = n_rows * n_columns <= MAX_ANNOTATED_CELLS
+
+        vmin, vmax = cube.value_range()
+        if cube.kind in ("signature_rule", "nash_rule"):
+            # one color per rule that occurs in the cube
+            rule_ids = np.unique(cube.values[~np.isnan(cube.values)]).astype(int)
+            rules = SIGNATURE_RULES if cube.kind == "signature_rule" else NASH_RULES
+            self.labels = {rule_id: rules[rule_id].replace("Rule ", "") for rule_id in rule_ids}
+            cmap = colormaps["viridis"].resampled(int(vmax - vmin) + 1)
+            vmin, vmax = vmin - 0.5, vmax + 0.5
+        else:
+            self.labels = None
+            cmap = colormaps["viridis"]
+
+        ax = self.ax = figure.add_subplot()
+        self.image = ax.imshow(cube.values[0], cmap=cmap, vmin=vmin, vmax=vmax, origin="upper",
+                               aspect="auto", interpolation="nearest")
+        color_bar = figure.colorbar(self.image, ax=ax)
+        if self.labels is not None:
+            color_bar.set_ticks(list(self.labels))
+            color_bar.set_ticklabels([rules[rule_id] for rule_id in self.labels])
+        self._set_ticks(ax.set_yticks, ax.set_yticklabels, cube.M_A_values)
+        self._set_ticks(ax.set_xticks, ax.set_xticklabels, cube.M_B_values)
+        ax.set_xlabel("M_B")
+        ax.set_ylabel("M_A")
+
+        self.texts = None
+        if annotate:
+            self.texts = [[ax.text(k, j, "", ha="center", va="center", fontsize="small")
+                           for k in range(n_columns)] for j in range(n_rows)]
+        # lay the figure out with a title in place
+        self.draw(0)
+        figure.tight_layout()
+
+    def changing_artists(self):
+        """Returns the artists that change from one slice to the next."""
+        artists = [self.image, self.ax.title]
+        if self.texts is not None:
+            artists += [text for row in self.texts for text in row]
+        return artists
+
+    @staticmethod
+    def _set_ticks(set_ticks, set_labels, values, max_ticks=30):
+        step = max(1, -(-len(values) // max_ticks))
+        positions = np.arange(0, len(values), step)
+        set_ticks(positions)
+        set_labels([str(v) for v in values[positions]])
+
+    def _format(self, value):
+        if np.isnan(value):
+            return ""
+        if self.labels is not None:
+            return self.labels.get(int(value), "")
+        return str(int(value))
+
+    def draw(self, index):
+        """Shows the slice of the index-th R value."""
+        values = self.cube.values[index]
+        self.image.set_data(values)
+        self.ax.set_title(f"{self.cube.title} for R={self.cube.R_values[index]}")
+        if self.texts is not None:
+            # dark cells get white labels
+            low, high = self.image.norm.vmin, self.image.norm.vmax
+            light = (values - low) > 0.6 * (high - low)
+            for j, row in enumerate(self.texts):
+                for k, text in enumerate(row):
+                    text.set_text(self._format(values[j, k]))
+                    text.set_color("black" if light[j, k] else "white")
+
+
+def render_cube(cube, output_dir, image_format="png", dpi=100, annotate=None):
+    """
+    Renders every R slice of a cube to an image file without a display.
+
+    Files are named <metric>_R<R>.<image_format> in output_dir. Raster
+    images are blitted: the axes, ticks and color bar are drawn once, and
+    only the image, the cell labels and the title are redrawn per slice.
+
+    Parameters:
+    - cube (ResultsCube): Cube to render.
+    - output_dir (str): Directory of the image files, created if needed.
+    - image_format (str): Image format understood by matplotlib, e.g. "png", "svg" or "pdf".
+    - dpi (int): Resolution of raster images.
+    - annotate (bool, optional): See SliceRenderer.
+
+    Returns:
+    - list: Paths of the written files.
+    """
+    # draw on a figure with an Agg canvas directly, this neither needs a display nor touches pyplot's state
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    os.makedirs(output_dir, exist_ok=True)
+    n_rows, n_columns = cube.values.shape[1:]
+    figure = Figure(figsize=(min(4 + 0.45 * n_columns, 20), min(3 + 0.4 * n_rows, 16)))
+    figure.set_dpi(dpi)
+    canvas = FigureCanvasAgg(figure)
+    renderer = SliceRenderer(cube, figure, annotate)
+    raster = image_format.lower() in RASTER_FORMATS
+    if raster:
+        from matplotlib.image import imsave
+        for artist in renderer.changing_artists():
+            artist.set_animated(True)
+        canvas.draw()
+        background = canvas.copy_from_bbox(figure.bbox)
+
+    paths = []
+    for index, R in enumerate(cube.R_values):
+        renderer.draw(index)
+        path = os.path.join(output_dir, f"{cube.metric}_R{R}.{image_format}")
+        if raster:
+            canvas.restore_region(background)
+            for artist in renderer.changing_artists():
+                figure.draw_artist(artist)
+            imsave(path, np.asarray(canvas.buffer_rgba()), format=image_format, dpi=dpi)
+        else:
+            figure.savefig(path, format=image_format, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+def _render_metric(args):
+    results, metric, mirror, output_dir, image_format, dpi, annotate = args
+    return render_cube(ResultsCube(results, metric, mirror), output_dir, image_format, dpi, annotate)
+
+
+def render_metrics(results, metrics, output_dir, image_format="png", dpi=100, annotate=None, mirror=False, jobs=1):
+    """
+    Builds the cube of every metric and renders all of its slices.
+
+    Parameters:
+    - results (dict): Results as returned by load_results.
+    - metrics (list): Names of the metrics to render.
+    - output_dir (str): Directory of the image files.
+    - image_format (str): Image format, e.g. "png", "svg" or "pdf".
+    - dpi (int): Resolution of raster images.
+    - annotate (bool, optional): See SliceRenderer.
+    - mirror (bool): See ResultsCube.
+    - jobs (int): Number of worker processes rendering one metric each, 0 uses all cores.
+
+    Returns:
+    - dict: Maps every metric to the paths of its image files.
+    """
+    tasks = [(results, metric, mirror, output_dir, image_format, dpi, annotate) for metric in metrics]
+    jobs = min(jobs or os.cpu_count(), len(tasks))
+    if jobs <= 1:
+        return {metric: _render_metric(task) for metric, task in zip(metrics, tasks)}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(metrics, executor.map(_render_metric, tasks)))
+
+
+def view(cube, start_R=None):
+    """
+    Opens an interactive window showing one R slice of a cube at a time.
+
+    The left and right arrow keys step to the previous and next R.
+
+    Parameters:
+    - cube (ResultsCube): Cube to browse.
+    - start_R (int, optional): R of the first slice shown, by default the smallest R.
+    """
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(10, 8))
+    renderer = SliceRenderer(cube, figure)
+    current = [0 if start_R is None else int(np.clip(np.searchsorted(cube.R_values, start_R),
+                                                     0, len(cube.R_values) - 1))]
+
+    def on_key(event):
+        step = {"right": 1, "left": -1}.get(event.key)
+        if step is None:
+            return
+        current[0] = max(0, min(current[0] + step, len(cube.R_values) - 1))
+        renderer.draw(current[0])
+        figure.canvas.draw_idle()
+
+    figure.canvas.mpl_connect("key_press_event", on_key)
+    renderer.draw(current[0])
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map result metrics over M_A and M_B, one heatmap per R.")
+    parser.add_argument("--results", default=DEFAULT_RESULTS,
+                        help="Results CSV file, or Arrow IPC file ending in .arrow.")
+    parser.add_argument("--metric", nargs="+", default=["true_num_nash"], choices=list(METRICS) + ["all"],
+                        help="Metrics to map.")
+    parser.add_argument("--output-dir", default=None,
+                        help="Render all slices to image files in this directory instead of opening the viewer.")
+    parser.add_argument("--format", default="png", help="Image format of the rendered files.")
+    parser.add_argument("--dpi", type=int, default=100, help="Resolution of rendered raster images.")
+    parser.add_argument("--annotate", action="store_true", default=None,
+                        help=f"Write the value into every cell, by default for up to {MAX_ANNOTATED_CELLS} cells.")
+    parser.add_argument("--no-annotate", dest="annotate", action="store_false",
+                        help="Never write the values into the cells.")
+    parser.add_argument("--mirror", action="store_true", help="Fill M_A > M_B from the mirrored games.")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes rendering one metric each, 0 uses all cores.")
+    parser.add_argument("--R", type=int, default=None, help="R shown first by the viewer.")
+    args = parser.parse_args()
+
+    metrics = list(METRICS) if "all" in args.metric else args.metric
+    results = load_results(args.results, metrics)
+    if args.output_dir is not None:
+        rendered = render_metrics(results, metrics, args.output_dir, args.format, args.dpi, args.annotate,
+                                  args.mirror, args.jobs)
+        print(f"Rendered {sum(len(paths) for paths in rendered.values())} heatmaps to {args.output_dir}.")
+    else:
+        view(ResultsCube(results, metrics[0], args.mirror), args.R)
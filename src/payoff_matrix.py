@@ -1,48 +1,160 @@
+import csv
 import numpy as np
 import pandas as pd
 from copy import copy
+from src import instrumentation
+
+
+def read_payoff_csv(file_source):
+    # read the whole file at once, the first line holds player 2's strategy names
+    if hasattr(file_source, 'read'):
+        text = file_source.read()
+    else:
+        with open(file_source, newline='') as file:
+            text = file.read()
+    header, _, body = text.partition('\n')
+    header = header.rstrip('\r')
+    p2_strategies = next(csv.reader([header]))[1:]
+    # split off player 1's strategy names, the remaining "a,b" cells of a row form one flat list of numbers
+    rows = [line.split(',', 1) for line in body.replace('"', '').splitlines() if line.strip()]
+    p1_strategies = [label for label, _ in rows]
+    values = np.loadtxt([cells for _, cells in rows], delimiter=',', ndmin=2)
+    if values.shape[1] != 2 * len(p2_strategies):
+        raise ValueError('expected {} payoff pairs per row in {}, got {} values'.format(
+            len(p2_strategies), file_source, values.shape[1]))
+    # use integer names for player 1 if all of them are integers
+    try:
+        p1_strategies = [int(label) for label in p1_strategies]
+    except ValueError:
+        pass
+    return values.reshape(len(p1_strategies), len(p2_strategies), 2), p1_strategies, p2_strategies
+
+
+# maximum number of pairwise payoff comparisons held in memory at once by dominance_matrix
+DOMINANCE_BLOCK_ELEMENTS = 2 ** 24
+
+
+def dominance_matrix(payoffs, mode='strict', block_size=None):
+    # payoffs[i, k] is the payoff of strategy i against opponent strategy k,
+    # entry [i, j] of the result tells whether strategy i is strictly/weakly dominated by strategy j
+    n_strategies, n_opp_strategies = payoffs.shape
+    instrumentation.count('dominance_comparisons', n_strategies * n_strategies * n_opp_strategies)
+    if block_size is None:
+        block_size = max(1, DOMINANCE_BLOCK_ELEMENTS // max(1, n_strategies * n_opp_strategies))
+    is_dominated_by = np.empty((n_strategies, n_strategies), dtype=bool)
+    # compare a block of strategies against all strategies at once
+    for start in range(0, n_strategies, block_size):
+        block = payoffs[start:start + block_size, None, :]
+        less = block < payoffs[None, :, :]
+        strictly_dominated = less.all(axis=2)
+        if mode == 'strict':
+            is_dominated_by[start:start + block_size] = strictly_dominated
+        else:
+            less_equal = block <= payoffs[None, :, :]
+            is_dominated_by[start:start + block_size] = ~strictly_dominated & less_equal.all(axis=2) \
+                & less.any(axis=2)
+    return is_dominated_by
+
+
+def is_integral(payoffs):
+    # whether the payoffs are integers that an int64 holds exactly; infinite, NaN and huge floats are not
+    if payoffs.dtype.kind in 'iu':
+        return True
+    if not np.isfinite(payoffs).all() or (payoffs.size and np.abs(payoffs).max() >= 2.0 ** 63):
+        return False
+    return np.array_equal(payoffs, np.trunc(payoffs))
+
+
+def compact_int_dtype(payoffs):
+    # smallest of int16/int32/int64 that holds all payoffs
+    max_abs = np.abs(payoffs).max() if payoffs.size else 0
+    for dtype in (np.int16, np.int32):
+        if max_abs <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def scale_payoffs(payoffs):
+    # exact integer representation of float payoffs that are multiples of 1/2, as (payoffs * scale, scale);
+    # other payoffs are returned as they are with scale 1
+    for scale in (1, 2):
+        scaled = payoffs * scale if scale != 1 else payoffs
+        if is_integral(scaled):
+            return scaled.astype(compact_int_dtype(scaled)), scale
+    return payoffs, 1
+
+
+def payoffs_to_string(payoffs, scale, p1_strategies, p2_strategies):
+    # table of the payoffs in their original units, one "(p1, p2)" cell per strategy pair
+    rows, columns = payoffs.shape[:2]
+    payoffs = payoffs / scale if scale != 1 else payoffs
+    payoffs_2d = [['({}, {})'.format(*payoffs[i, j]) for j in range(columns)] for i in range(rows)]
+    payoffs_df = pd.DataFrame(payoffs_2d, index=p1_strategies, columns=p2_strategies)
+    return payoffs_df.to_string()
 
 
 class PayoffMatrix:
 
-    def __init__(self, payoffs=None, p1_strategies=None, p2_strategies=None, file_source=None):
+    def __init__(self, payoffs=None, p1_strategies=None, p2_strategies=None, file_source=None, copy_payoffs=True,
+                 scale=1):
+        # payoffs are stored as exact integers where possible: the actual payoffs are self.payoffs / self.scale,
+        # which does not change any comparison between them
+        self.scale = scale
         if file_source is None:
-            # initialize payoff matrix as a numpy array
-            self.payoffs = np.array(payoffs, dtype=np.float)
+            # initialize payoff matrix as a numpy array, integer arrays (e.g. memory-mapped games) are kept as they are
+            if not copy_payoffs and np.asarray(payoffs).dtype.kind in 'iuf':
+                self.payoffs = np.asarray(payoffs)
+            else:
+                self.payoffs = np.array(payoffs, dtype=float)
             # if strategy names are not set or have the wrong length, give them index labels
             if p1_strategies is None or len(p1_strategies) != self.payoffs.shape[0]:
-                self.p1_strategies = np.arange(self.payoffs.shape[0])
+                self.p1_strategies = list(range(self.payoffs.shape[0]))
             else:
                 self.p1_strategies = copy(p1_strategies)
             if p2_strategies is None or len(p2_strategies) != self.payoffs.shape[1]:
-                self.p1_strategies = np.arange(self.payoffs.shape[1])
+                self.p2_strategies = list(range(self.payoffs.shape[1]))
             else:
                 self.p2_strategies = copy(p2_strategies)
         else:
-            # convert 2d string array to 3d array of floats
-            df = pd.read_csv(file_source, index_col=0, header=0)
-            self.payoffs = np.zeros((df.values.shape[0], df.values.shape[1], 2))
-            for i in range(df.values.shape[0]):
-                for j in range(df.values.shape[1]):
-                    for k, p in enumerate(df.values[i, j].split(',')):
-                        self.payoffs[i, j, k] = float(p)
-            # read index/column names from dataframe and use them as player 1 / player 2 strategy names
-            self.p1_strategies = list(df.index.values)
-            self.p2_strategies = list(df.columns.values)
-        # if possible, convert payoffs to integers
-        if np.all(self.payoffs % 1 == 0):
-            self.payoffs = self.payoffs.astype(int)
+            self.payoffs, self.p1_strategies, self.p2_strategies = read_payoff_csv(file_source)
+        # if possible, convert payoffs to integers in half units
+        if self.payoffs.dtype.kind == 'f':
+            self.payoffs, scale = scale_payoffs(self.payoffs)
+            self.scale *= scale
+        # label -> index lookup tables, built on first use
+        self._strategy_indices = {}
+
+    def strategy_index(self, player, strategy):
+        strategy_names = self.p1_strategies if player == 1 else self.p2_strategies
+        # rebuild the lookup table if the strategy list was replaced or changed its length
+        cached = self._strategy_indices.get(player)
+        if cached is None or cached[0] is not strategy_names or len(cached[1]) != len(strategy_names):
+            indices = {}
+            for i, name in enumerate(strategy_names):
+                indices.setdefault(name, i)
+            cached = self._strategy_indices[player] = (strategy_names, indices)
+        try:
+            return cached[1][strategy]
+        except KeyError:
+            raise ValueError('{} is not a strategy of player {}'.format(strategy, player)) from None
+
+    def best_response_masks(self):
+        # [i, j] of the first mask: row i is a best response of player 1 to column j,
+        # [i, j] of the second mask: column j is a best response of player 2 to row i
+        p1_payoffs = self.payoffs[:, :, 0]
+        p2_payoffs = self.payoffs[:, :, 1]
+        return p1_payoffs == p1_payoffs.max(axis=0, keepdims=True), p2_payoffs == p2_payoffs.max(axis=1, keepdims=True)
 
     def best_responses(self, player, opp_strategy):
         if player == 1:
             strategy_names = self.p1_strategies
             # get column number of opponent's strategy and the corresponding payoffs
-            column_number = self.p2_strategies.index(opp_strategy)
+            column_number = self.strategy_index(2, opp_strategy)
             payoffs = self.payoffs[:, column_number, 0]
         else:
             strategy_names = self.p2_strategies
             # get row number of opponent's strategy and the corresponding payoffs
-            row_number = self.p1_strategies.index(opp_strategy)
+            row_number = self.strategy_index(1, opp_strategy)
             payoffs = self.payoffs[row_number, :, 1]
         # get value of maximum payoff given that the opponent plays opp_strategy
         best_payoff = np.max(payoffs)
@@ -51,47 +163,47 @@ class PayoffMatrix:
         # return corresponding strategy names
         return [strategy_names[i] for i in best_indices]
 
-    def dominated_strategies(self, player, mode='strict'):
-        dominated_strategies = {}
-        # iterate over all of player's strategies
-        for n_strategy in range(self.payoffs.shape[player - 1]):
-            # get payoffs of current strategy across all strategies of opponent
-            payoffs = self.payoffs[n_strategy, :, 0] if player == 1 else self.payoffs[:, n_strategy, 1]
-            # iterate over all other player's strategies
-            for n_other_strategy in range(self.payoffs.shape[player - 1]):
-                if n_other_strategy == n_strategy:
-                    continue
-                # get payoffs of current other strategy across all strategies of opponent
-                if player == 1:
-                    other_payoffs = self.payoffs[n_other_strategy, :, 0]
-                else:
-                    other_payoffs = self.payoffs[:, n_other_strategy, 1]
-                # add strategy to dominated strategies if it is strictly/weakly dominated by the other strategy
-                strictly_dominated = np.all(payoffs < other_payoffs)
-                weakly_dominated = not strictly_dominated and np.all(payoffs <= other_payoffs) \
-                    and np.any(payoffs < other_payoffs)
-                if mode == 'strict' and strictly_dominated or mode == 'weak' and weakly_dominated:
-                    strategy_names = self.p1_strategies if player == 1 else self.p2_strategies
-                    dominated_strategies[strategy_names[n_strategy]] = strategy_names[n_other_strategy]
-                    break
-        return dominated_strategies
+    def dominated_strategies(self, player, mode='strict', block_size=None):
+        # get payoffs of each of player's strategies (rows) across all strategies of opponent (columns)
+        payoffs = self.payoffs[:, :, 0] if player == 1 else self.payoffs[:, :, 1].T
+        is_dominated_by = dominance_matrix(payoffs, mode, block_size)
+        # map each dominated strategy to the first strategy dominating it
+        strategy_names = self.p1_strategies if player == 1 else self.p2_strategies
+        dominated = np.flatnonzero(is_dominated_by.any(axis=1))
+        dominating = is_dominated_by[dominated].argmax(axis=1)
+        return {strategy_names[i]: strategy_names[j] for i, j in zip(dominated, dominating)}
 
     def eliminate_strategy(self, player, strategy):
         if player == 1:
             # get row number of strategy, then remove it from list
-            index = self.p1_strategies.index(strategy)
-            self.p1_strategies.remove(strategy)
+            index = self.strategy_index(1, strategy)
+            del self.p1_strategies[index]
         else:
             # get column number of strategy, then remove it from list
-            index = self.p2_strategies.index(strategy)
-            self.p2_strategies.remove(strategy)
+            index = self.strategy_index(2, strategy)
+            del self.p2_strategies[index]
         # remove corresponding row/column from payoff matrix
         self.payoffs = np.delete(self.payoffs, index, player-1)
+        instrumentation.count('array_copies')
+        instrumentation.count('array_copy_bytes', self.payoffs.nbytes)
+
+    def keep_strategies(self, p1_indices, p2_indices):
+        # reduce the game to the given rows/columns in one step
+        self.payoffs = self.payoffs[np.ix_(p1_indices, p2_indices)]
+        instrumentation.count('array_copies')
+        instrumentation.count('array_copy_bytes', self.payoffs.nbytes)
+        self.p1_strategies = [self.p1_strategies[i] for i in p1_indices]
+        self.p2_strategies = [self.p2_strategies[i] for i in p2_indices]
+
+    def actual_payoffs(self):
+        # payoffs in their original units
+        return self.payoffs / self.scale if self.scale != 1 else self.payoffs
 
     def output(self, target_file=None):
-        # convert payoff matrix to a 2d string array 
+        # convert payoff matrix to a 2d string array
         rows, columns = self.payoffs.shape[:2]
-        payoffs_2d = [['{}, {}'.format(*self.payoffs[i, j]) for j in range(columns)] for i in range(rows)]
+        payoffs = self.actual_payoffs()
+        payoffs_2d = [['{}, {}'.format(*payoffs[i, j]) for j in range(columns)] for i in range(rows)]
         # create pandas dataframe, convert it to a string, and print it
         payoffs_df = pd.DataFrame(payoffs_2d, index=self.p1_strategies, columns=self.p2_strategies)
         print(payoffs_df.to_string())
@@ -100,7 +212,4 @@ class PayoffMatrix:
             payoffs_df.to_csv(target_file)
 
     def output_to_string(self):
-        rows, columns = self.payoffs.shape[:2]
-        payoffs_2d = [['({}, {})'.format(*self.payoffs[i, j]) for j in range(columns)] for i in range(rows)]
-        payoffs_df = pd.DataFrame(payoffs_2d, index=self.p1_strategies, columns=self.p2_strategies)
-        return payoffs_df.to_string()
\ No newline at end of file
+        return payoffs_to_string(self.payoffs, self.scale, self.p1_strategies, self.p2_strategies)
\ No newline at end of file
@@ -1,3 +1,5 @@
+import numpy as np
+
 # def predict_pure_nash_with_conjecture(R, M_A, M_B, applied_rule):
 #     """
 #     Predicts the number of pure Nash equilibria based on the conjecture rules.
@@ -90,4 +92,44 @@ def predict_pure_nash_with_locations(R, M_A, M_B):
             return 0, [], "Rule Cb"  # No pure Nash equilibria
 
     # Default fallback
-    return 0, [], "No Rule"
\ No newline at end of file
+    return 0, [], "No Rule"
+
+
+# rule names by rule id, as returned by predict_pure_nash_with_locations
+NASH_RULES = ("No Rule", "Rule A", "Rule B", "Rule Ca", "Rule Cb")
+
+# maximum number of predicted equilibria of a game
+MAX_PREDICTED_NASH = 4
+
+def predict_pure_nash_array(R, M_A, M_B):
+    """
+    Array version of predict_pure_nash_with_locations for many games at once.
+
+    Args:
+        R (np.ndarray): Investment budgets, broadcast against M_A and M_B.
+        M_A (np.ndarray): Number of strategies available to Player A.
+        M_B (np.ndarray): Number of strategies available to Player B.
+
+    Returns:
+        tuple: A tuple containing:
+            - np.ndarray: Predicted number of pure Nash equilibria of each game.
+            - np.ndarray: Predicted locations, of shape (..., MAX_PREDICTED_NASH, 2). The locations
+              of a game are its first count entries, in the same order as the scalar version,
+              the remaining entries are -1.
+            - np.ndarray: Rule ids, NASH_RULES[rule_id] is the name of the rule.
+    """
+    R, M_A, M_B = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in (R, M_A, M_B)))
+    M_min = np.minimum(M_A, M_B)
+    symmetric = M_A == M_B
+
+    rule_id = np.select(
+        [R == 1, R == 2, (R > 2) & symmetric & (M_min <= R // 2), R > 2],
+        [1, 2, 3, 4], default=0)
+    counts = np.array([0, 1, 4, 1, 0])[rule_id]
+
+    locations = np.full(R.shape + (MAX_PREDICTED_NASH, 2), -1, dtype=np.int64)
+    locations[rule_id == 1, 0] = (0, 0)
+    locations[rule_id == 2] = [(0, 0), (0, 1), (1, 0), (1, 1)]
+    is_rule_ca = rule_id == 3
+    locations[is_rule_ca, 0] = M_min[is_rule_ca, None]
+    return counts, locations, rule_id
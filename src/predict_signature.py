@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 def predict_signature(R, M_A, M_B):
     """
     Returns a tuple (predicted_strategies_P1, predicted_strategies_P2, "Rule X"),
@@ -113,3 +115,45 @@ def predict_signature(R, M_A, M_B):
         first_signature, second_signature = second_signature, first_signature
 
     return (first_signature, second_signature, rule)
+
+
+# rule names by rule id, rule id i is "Rule i"
+SIGNATURE_RULES = ("", "Rule 1", "Rule 2", "Rule 3", "Rule 4", "Rule 5", "Rule 6")
+
+def predict_signature_array(R, M_A, M_B):
+    """
+    Array version of predict_signature for many games at once.
+
+    R, M_A and M_B are integer arrays (or scalars) that are broadcast
+    against each other. Every predicted signature is a contiguous range of
+    strategies, so it is returned as inclusive bounds: the signature of
+    player 1 is range(p1_lo, p1_hi + 1), it is empty where p1_hi < p1_lo.
+    SIGNATURE_RULES[rule_id] is the rule name returned by predict_signature.
+    Unlike predict_signature, nothing is printed for the debug game (6, 7, 9).
+
+    Returns a tuple ((p1_lo, p1_hi), (p2_lo, p2_hi), rule_id) of integer arrays.
+    """
+    R, M_A, M_B = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in (R, M_A, M_B)))
+    swapped = M_A > M_B
+    symmetric = M_A == M_B
+    M_min = np.minimum(M_A, M_B)
+    half_ceil = -(-R // 2)
+    top = np.minimum(M_min, R)
+
+    rule_id = np.select(
+        [R < 2, symmetric & (2 * M_min < R), symmetric, M_min < half_ceil, M_min < R],
+        [1, 2, 3, 4, 5], default=6)
+
+    # bounds of the player with the smaller and the larger maximum investment, by rule id
+    zero = np.zeros_like(R)
+    first_lo = np.choose(rule_id - 1, [zero, M_min, zero, zero, zero, zero])
+    first_hi = np.choose(rule_id - 1, [zero, M_min, top, M_min, top, R])
+    second_lo = np.choose(rule_id - 1, [zero, M_min, zero, zero + 1, zero, zero])
+    second_hi = np.choose(rule_id - 1, [zero, M_min, top, M_min + 1, top + 1, R])
+
+    # swap back if necessary
+    p1_lo = np.where(swapped, second_lo, first_lo)
+    p1_hi = np.where(swapped, second_hi, first_hi)
+    p2_lo = np.where(swapped, first_lo, second_lo)
+    p2_hi = np.where(swapped, first_hi, second_hi)
+    return (p1_lo, p1_hi), (p2_lo, p2_hi), rule_id
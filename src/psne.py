@@ -1,15 +1,18 @@
 import numpy as np
 import pandas as pd
+from src.payoff_matrix import dominance_matrix, payoffs_to_string
+from src import instrumentation
 
 
 def __show_best_responses(payoff_matrix, is_best_response):
     # convert payoff matrix to a 2d string array with best responses marked with *
+    payoffs = payoff_matrix.actual_payoffs()
     payoffs_2d = []
-    for i in range(payoff_matrix.payoffs.shape[0]):
+    for i in range(payoffs.shape[0]):
         row = []
-        for j in range(payoff_matrix.payoffs.shape[1]):
-            entry = '{}{},'.format(payoff_matrix.payoffs[i, j, 0], '*' if is_best_response[i, j, 0] else '')
-            entry += ' {}{}'.format(payoff_matrix.payoffs[i, j, 1], '*' if is_best_response[i, j, 1] else '')
+        for j in range(payoffs.shape[1]):
+            entry = '{}{},'.format(payoffs[i, j, 0], '*' if is_best_response[i, j, 0] else '')
+            entry += ' {}{}'.format(payoffs[i, j, 1], '*' if is_best_response[i, j, 1] else '')
             row.append(entry)
         payoffs_2d.append(row)
     # create pandas dataframe, convert it to a string, and print it
@@ -17,104 +20,187 @@ def __show_best_responses(payoff_matrix, is_best_response):
     print(payoffs_df.to_string() + '\n\n')
 
 
-def best_responses(payoff_matrix, show_steps=True):
+TRACE_MODES = ('none', 'events', 'full')
+
+
+class MatrixSnapshot:
+    # state of a payoff matrix during IESDS, only rendered to a string when it is printed
+    def __init__(self, payoff_matrix):
+        # eliminations replace the payoff array instead of modifying it, so keeping a reference is enough
+        self.payoffs = payoff_matrix.payoffs
+        self.scale = payoff_matrix.scale
+        self.p1_strategies = list(payoff_matrix.p1_strategies)
+        self.p2_strategies = list(payoff_matrix.p2_strategies)
+
+    def __str__(self):
+        return payoffs_to_string(self.payoffs, self.scale, self.p1_strategies, self.p2_strategies)
+
+
+def _logger(show_steps, trace):
+    if trace not in TRACE_MODES:
+        raise ValueError('trace must be one of {}, got {!r}'.format(TRACE_MODES, trace))
     log_steps = []
-    def log(msg):
-        if show_steps:
-            print(msg)
-        log_steps.append(msg)
+    def log(msg, *args):
+        # format the message only if it is printed or kept in a full trace
+        if show_steps or trace == 'full':
+            msg = msg.format(*args)
+            if show_steps:
+                print(msg)
+            if trace == 'full':
+                log_steps.append(msg)
+    return log_steps, log
+
+
+def best_responses(payoff_matrix, show_steps=True, trace='none'):
+    log_steps, log = _logger(show_steps, trace)
 
     p1_strats = payoff_matrix.p1_strategies
     p2_strats = payoff_matrix.p2_strategies
 
-    # First, find best responses of Player 1 to each of Player 2's strategies
-    p1_best_responses = {}  # dict mapping p2_strategy -> list of p1 best responses
-    for p2_s in p2_strats:
-        p1_br = payoff_matrix.best_responses(player=1, opp_strategy=p2_s)
-        p1_best_responses[p2_s] = p1_br
-        for br_s in p1_br:
-            log(f"{br_s} is player 1's best response to player 2 playing {p2_s}.")
-
-    # Next, find best responses of Player 2 to each of Player 1's strategies
-    p2_best_responses = {}  # dict mapping p1_strategy -> list of p2 best responses
-    for p1_s in p1_strats:
-        p2_br = payoff_matrix.best_responses(player=2, opp_strategy=p1_s)
-        p2_best_responses[p1_s] = p2_br
-        for br_s in p2_br:
-            log(f"{br_s} is player 2's best response to player 1 playing {p1_s}.")
+    # Best responses of both players to every strategy of the opponent, as boolean masks over the matrix
+    p1_is_best_response, p2_is_best_response = payoff_matrix.best_response_masks()
+
+    if show_steps or trace == 'full':
+        # First, log best responses of Player 1 to each of Player 2's strategies
+        for j, p2_s in enumerate(p2_strats):
+            for i in np.flatnonzero(p1_is_best_response[:, j]):
+                log("{} is player 1's best response to player 2 playing {}.", p1_strats[i], p2_s)
+
+        # Next, log best responses of Player 2 to each of Player 1's strategies
+        for i, p1_s in enumerate(p1_strats):
+            for j in np.flatnonzero(p2_is_best_response[i, :]):
+                log("{} is player 2's best response to player 1 playing {}.", p2_strats[j], p1_s)
 
     # Check for pure strategy Nash equilibria:
     # A pure strategy (p1_s, p2_s) is a Nash equilibrium if p1_s is a best response to p2_s
     # AND p2_s is a best response to p1_s.
-    nash_equilibria = []
-    for p1_s in p1_strats:
-        for p2_s in p2_strats:
-            if (p1_s in p1_best_responses[p2_s]) and (p2_s in p2_best_responses[p1_s]):
-                nash_equilibria.append((p1_s, p2_s))
+    nash_equilibria = [(p1_strats[i], p2_strats[j])
+                       for i, j in np.argwhere(p1_is_best_response & p2_is_best_response)]
 
     if nash_equilibria:
         log("Found pure strategy Nash equilibria:")
         for eq in nash_equilibria:
-            log(f"NE: <{eq[0]}, {eq[1]}>")
+            log("NE: <{}, {}>", eq[0], eq[1])
         return (nash_equilibria, log_steps)
     else:
         log("There are no pure strategy Nash equilibria.")
         return ([], log_steps)
 
 
-def IESDS(payoff_matrix, show_steps=True):
-    log_steps = []
-    def log(msg):
-        # A small helper to either print (if show_steps) and store the msg.
+def surviving_strategies(payoffs, on_elimination=None):
+    # track the surviving rows/columns as index arrays into the full payoff matrix
+    surviving = {1: np.arange(payoffs.shape[0]), 2: np.arange(payoffs.shape[1])}
+    # a player's dominance relation can only change after the opponent lost a strategy
+    needs_check = {1: True, 2: True}
+    n_round = 0
+    while needs_check[1] or needs_check[2]:
+        n_round += 1
+        for player, opponent in ((1, 2), (2, 1)):
+            if not needs_check[player]:
+                continue
+            needs_check[player] = False
+            rows, columns = surviving[1], surviving[2]
+            if player == 1:
+                player_payoffs = payoffs[rows[:, None], columns, 0]
+            else:
+                player_payoffs = payoffs[rows[:, None], columns, 1].T
+            instrumentation.count('array_copies')
+            instrumentation.count('array_copy_bytes', player_payoffs.nbytes)
+            is_dominated_by = dominance_matrix(player_payoffs)
+            dominated = is_dominated_by.any(axis=1)
+            if not dominated.any():
+                continue
+            # eliminate all strictly dominated strategies of the player at once
+            if on_elimination is not None:
+                for i in np.flatnonzero(dominated):
+                    # report a dominating strategy that survives this round
+                    j = (is_dominated_by[i] & ~dominated).argmax()
+                    on_elimination(player, surviving[player][i], surviving[player][j], n_round)
+            surviving[player] = surviving[player][~dominated]
+            needs_check[opponent] = True
+    instrumentation.count('iesds_rounds', n_round)
+    return surviving[1], surviving[2]
+
+
+def IESDS(payoff_matrix, show_steps=True, batched=False, trace='none'):
+    # trace='none' records nothing, 'events' records (player, dominated, dominating, round) tuples,
+    # 'full' records all messages and snapshots of the payoff matrix, rendered when converted to strings
+    log_steps, log = _logger(show_steps, trace)
+
+    def record_elimination(player, dominated, dominating, n_round):
+        log("Player {}'s strategy {} is strictly dominated by {}.\n", player, dominated, dominating)
+        if trace == 'events':
+            log_steps.append((player, dominated, dominating, n_round))
+
+    def record_matrix():
         if show_steps:
-            print(msg)
-        log_steps.append(msg)
-
-    # Get player 1's and player 2's dominated strategies
-    p1_dominated_strategies = payoff_matrix.dominated_strategies(player=1)
-    p2_dominated_strategies = payoff_matrix.dominated_strategies(player=2)
+            payoff_matrix.output()
+            print()
+        if trace == 'full':
+            log_steps.append(MatrixSnapshot(payoff_matrix))  # store payoff matrix state
 
     # Print initial payoff matrix
-    if show_steps:
-        payoff_matrix.output()
-        print()
-    log_steps.append(payoff_matrix.output_to_string())  # store payoff matrix state
+    record_matrix()
+
+    if batched:
+        # Eliminate all strictly dominated strategies of a player per round, then reduce the matrix once
+        def on_elimination(player, dominated, dominating, n_round):
+            strategy_names = payoff_matrix.p1_strategies if player == 1 else payoff_matrix.p2_strategies
+            record_elimination(player, strategy_names[dominated], strategy_names[dominating], n_round)
+
+        with instrumentation.stage('iesds.dominance'):
+            p1_surviving, p2_surviving = surviving_strategies(
+                payoff_matrix.payoffs, on_elimination if show_steps or trace != 'none' else None)
+        if len(p1_surviving) < len(payoff_matrix.p1_strategies) or len(p2_surviving) < len(payoff_matrix.p2_strategies):
+            with instrumentation.stage('iesds.eliminate'):
+                payoff_matrix.keep_strategies(p1_surviving, p2_surviving)
+            record_matrix()
+        p1_dominated_strategies = p2_dominated_strategies = {}
+    else:
+        # Get player 1's and player 2's dominated strategies
+        with instrumentation.stage('iesds.dominance'):
+            p1_dominated_strategies = payoff_matrix.dominated_strategies(player=1)
+            p2_dominated_strategies = payoff_matrix.dominated_strategies(player=2)
 
     # Iterate while there are dominated strategies to be eliminated
+    n_round = 0
     while len(p1_dominated_strategies) > 0 or len(p2_dominated_strategies) > 0:
+        n_round += 1
+        instrumentation.count('iesds_rounds')
         if len(p1_dominated_strategies) > 0:
             # Eliminate first dominated player 1 strategy
             dominated_strategy = list(p1_dominated_strategies)[0]
             dominating_strategy = p1_dominated_strategies[dominated_strategy]
-            payoff_matrix.eliminate_strategy(player=1, strategy=dominated_strategy)
-            log("Player 1's strategy {} is strictly dominated by {}.\n".format(dominated_strategy, dominating_strategy))
+            with instrumentation.stage('iesds.eliminate'):
+                payoff_matrix.eliminate_strategy(player=1, strategy=dominated_strategy)
+            record_elimination(1, dominated_strategy, dominating_strategy, n_round)
         else:
             # Eliminate first dominated player 2 strategy
             dominated_strategy = list(p2_dominated_strategies)[0]
             dominating_strategy = p2_dominated_strategies[dominated_strategy]
-            payoff_matrix.eliminate_strategy(player=2, strategy=dominated_strategy)
-            log("Player 2's strategy {} is strictly dominated by {}.\n".format(dominated_strategy, dominating_strategy))
+            with instrumentation.stage('iesds.eliminate'):
+                payoff_matrix.eliminate_strategy(player=2, strategy=dominated_strategy)
+            record_elimination(2, dominated_strategy, dominating_strategy, n_round)
 
         # Update dominated strategies
-        p1_dominated_strategies = payoff_matrix.dominated_strategies(player=1)
-        p2_dominated_strategies = payoff_matrix.dominated_strategies(player=2)
+        with instrumentation.stage('iesds.dominance'):
+            p1_dominated_strategies = payoff_matrix.dominated_strategies(player=1)
+            p2_dominated_strategies = payoff_matrix.dominated_strategies(player=2)
 
         # Print updated payoff matrix
-        if show_steps:
-            payoff_matrix.output()
-            print()
-        log_steps.append(payoff_matrix.output_to_string())
+        record_matrix()
 
     # If there is only one strategy left for each player, return it as a PSNE
     if len(payoff_matrix.p1_strategies) == 1 and len(payoff_matrix.p2_strategies) == 1:
         p1_strategy = payoff_matrix.p1_strategies[0]
         p2_strategy = payoff_matrix.p2_strategies[0]
-        log('<{}, {}> is a pure strategy Nash equilibrium.'.format(p1_strategy, p2_strategy))
+        log('<{}, {}> is a pure strategy Nash equilibrium.', p1_strategy, p2_strategy)
         return ([(p1_strategy, p2_strategy)], log_steps)
 
     # Otherwise, continue with best responses
     log('There are no strictly dominated strategies left to eliminate. Continuing with best responses...\n')
-    br_results, br_log = best_responses(payoff_matrix, show_steps=show_steps)
+    with instrumentation.stage('iesds.best_responses'):
+        br_results, br_log = best_responses(payoff_matrix, show_steps=show_steps, trace='full' if trace == 'full' else 'none')
     log_steps.extend(br_log)
 
     return (br_results, log_steps)
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from src.canonical import solve as solve_canonical
+from src.sweep import evaluate_game
+
+# largest accepted request line, a batch of a few thousand games fits easily
+MAX_LINE = 2 ** 24
+
+
+def answer(R, M_A, M_B):
+    """
+    Solves a game and evaluates the predictions for it, e.g. inside a worker process.
+
+    Returns:
+    - dict: The result record of src.sweep.evaluate_game: true and predicted
+      signature, number and locations of the pure Nash equilibria, the rules
+      used and whether each prediction is correct.
+    """
+    return evaluate_game(R, M_A, M_B, *solve_canonical(R, M_A, M_B))
+
+
+def _answer_star(game):
+    return answer(*game)
+
+
+def _answer_chunk(games):
+    return [answer(*game) for game in games]
+
+
+def parse_game(game):
+    """Returns a requested game as an (R, M_A, M_B) tuple of positive integers, or raises ValueError."""
+    if not isinstance(game, (list, tuple)) or len(game) != 3 \
+            or not all(isinstance(v, int) and not isinstance(v, bool) and v >= 1 for v in game):
+        raise ValueError(f"a game is a list [R, M_A, M_B] of positive integers, got {game!r}")
+    return tuple(game)
+
+
+class QueryService:
+    """
+    Answers queries for solved games from an in-process LRU cache and a worker pool.
+
+    Cached games are answered immediately. Other games are solved in worker
+    processes, so the event loop keeps serving cheap lookups while large
+    games are solved. Concurrent queries for the same game share one solve.
+
+    Parameters:
+    - max_cache (int): Maximum number of games in the LRU cache.
+    - jobs (int): Number of worker processes.
+    """
+
+    def __init__(self, max_cache=100000, jobs=1):
+        self.max_cache = max_cache
+        self.jobs = jobs
+        self.cache = OrderedDict()
+        self.executor = ProcessPoolExecutor(max_workers=jobs)
+        self._pending = {}
+        # solves submitted to the executor and not finished yet
+        self._solves = set()
+        # tasks serving the open connections
+        self._connections = set()
+        self.stats = {"requests": 0, "games": 0, "cache_hits": 0, "solved": 0, "errors": 0, "evictions": 0}
+
+    def close(self):
+        # drop the solves that did not start yet
+        for solve in list(self._solves):
+            solve.cancel()
+        self.executor.shutdown()
+
+    def _store(self, game, result):
+        self.cache[game] = result
+        if len(self.cache) > self.max_cache:
+            self.cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _submit(self, games):
+        """
+        Returns a future for the result record of every game, sharing the
+        pending solves of games that are already being solved.
+
+        New games are solved in chunks, one per worker, to keep the pickling
+        overhead of many small games low. The futures are completed by a
+        done callback of the executor future, never by a requester, so
+        cancelling a requester does not affect the others.
+        """
+        futures = {game: self._pending[game] for game in games if game in self._pending}
+        unsolved = [game for game in dict.fromkeys(games) if game not in futures]
+        if not unsolved:
+            return futures
+        loop = asyncio.get_running_loop()
+        n_chunks = min(len(unsolved), self.jobs)
+        for chunk in (unsolved[i::n_chunks] for i in range(n_chunks)):
+            game_futures = [loop.create_future() for _ in chunk]
+            for game, future in zip(chunk, game_futures):
+                # an exception nobody waits for any more is not reported as never retrieved
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._pending[game] = futures[game] = future
+            solve = self.executor.submit(_answer_chunk, chunk)
+            self._solves.add(solve)
+            solve.add_done_callback(lambda solve, chunk=chunk, game_futures=game_futures:
+                                    loop.call_soon_threadsafe(self._finish, chunk, game_futures, solve))
+        return futures
+
+    def _finish(self, chunk, game_futures, solve):
+        # completes the futures of a finished chunk solve and caches its results, on the event loop
+        self._solves.discard(solve)
+        for game in chunk:
+            del self._pending[game]
+        if solve.cancelled() or solve.exception() is not None:
+            for future in game_futures:
+                if solve.cancelled():
+                    future.cancel()
+                else:
+                    future.set_exception(solve.exception())
+            return
+        for game, future, result in zip(chunk, game_futures, solve.result()):
+            self.stats["solved"] += 1
+            self._store(game, result)
+            future.set_result(result)
+
+    def _lookup(self, game):
+        result = self.cache.get(game)
+        if result is not None:
+            self.cache.move_to_end(game)
+            self.stats["cache_hits"] += 1
+        return result
+
+    async def query(self, game):
+        """Returns the result record of an (R, M_A, M_B) game."""
+        self.stats["games"] += 1
+        result = self._lookup(game)
+        if result is not None:
+            return result
+        return await asyncio.shield(self._submit([game])[game])
+
+    async def batch(self, games):
+        """Returns the result records of a list of games, in order."""
+        self.stats["games"] += len(games)
+        results = [self._lookup(game) for game in games]
+        missing = [game for game, result in zip(games, results) if result is None]
+        if missing:
+            futures = self._submit(missing)
+            solved = dict(zip(futures, await asyncio.gather(*(asyncio.shield(f) for f in futures.values()))))
+            results = [solved[game] if result is None else result for game, result in zip(games, results)]
+        return results
+
+    async def handle(self, request):
+        """
+        Answers one request, a dict with an "op" and an optional "id" that is
+        copied to the response:
+        - {"op": "solve", "game": [R, M_A, M_B]}: the result record of a game;
+        - {"op": "batch", "games": [[R, M_A, M_B], ...]}: the records of many games;
+        - {"op": "stats"}: cache and request statistics;
+        - {"op": "ping"}.
+
+        Returns:
+        - dict: {"id": ..., "result": ...} or {"id": ..., "error": message}.
+        """
+        self.stats["requests"] += 1
+        response = {"id": request.get("id")} if isinstance(request, dict) else {"id": None}
+        try:
+            if not isinstance(request, dict):
+                raise ValueError(f"a request is a JSON object, got {request!r}")
+            op = request.get("op")
+            if op == "solve":
+                response["result"] = await self.query(parse_game(request.get("game")))
+            elif op == "batch":
+                games = request.get("games")
+                if not isinstance(games, list):
+                    raise ValueError("a batch request needs a list of games")
+                response["result"] = await self.batch([parse_game(game) for game in games])
+            elif op == "stats":
+                response["result"] = dict(self.stats, cached=len(self.cache), pending=len(self._pending))
+            elif op == "ping":
+                response["result"] = "pong"
+            else:
+                raise ValueError(f"unknown op {op!r}, expected solve, batch, stats or ping")
+        except Exception as error:
+            # any failure, e.g. of a worker on a game too large to solve, is reported to the client
+            self.stats["errors"] += 1
+            response["error"] = str(error) or type(error).__name__
+        return response
+
+    async def serve_connection(self, reader, writer):
+        """
+        Serves a client speaking JSON lines: one request per line, one response
+        per line. Requests are answered concurrently, so responses may come out
+        of order and are matched to requests by their id.
+        """
+        write_lock = asyncio.Lock()
+        tasks = set()
+        self._connections.add(asyncio.current_task())
+
+        async def respond(line):
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                self.stats["errors"] += 1
+                response = {"id": None, "error": f"invalid JSON: {error}"}
+            else:
+                response = await self.handle(request)
+            async with write_lock:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError, asyncio.CancelledError):
+            # the client went away, sent a line that is too long, or the server is shutting down
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+
+async def serve(socket_path=None, port=None, max_cache=100000, jobs=1, ready=None):
+    """
+    Runs the query service until it is cancelled, on a Unix socket or on a
+    TCP port of the loopback interface. The service never listens on other
+    interfaces.
+
+    Parameters:
+    - socket_path (str, optional): Path of the Unix socket, replaced if it exists.
+    - port (int, optional): Port on 127.0.0.1, used if no socket path is given.
+    - max_cache (int): Maximum number of games in the LRU cache.
+    - jobs (int): Number of worker processes.
+    - ready (callable, optional): Called with the listening address once the server accepts connections.
+    """
+    if (socket_path is None) == (port is None):
+        raise ValueError("serve needs either a socket path or a port")
+    service = QueryService(max_cache, jobs)
+    try:
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(service.serve_connection, socket_path, limit=MAX_LINE)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(service.serve_connection, "127.0.0.1", port, limit=MAX_LINE)
+            address = server.sockets[0].getsockname()[:2]
+        if ready is not None:
+            ready(address)
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                # connections still waiting for solves would keep the server from closing
+                for connection in list(service._connections):
+                    connection.cancel()
+    finally:
+        service.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class QueryClient:
+    """
+    Blocking client of the query service, e.g. for notebooks and scripts.
+
+    Parameters:
+    - socket_path (str, optional): Path of the service's Unix socket.
+    - port (int, optional): Port of the service on 127.0.0.1, used if no socket path is given.
+    - timeout (float, optional): Socket timeout in seconds, large games may take minutes to solve.
+      None waits indefinitely.
+    """
+
+    def __init__(self, socket_path=None, port=None, timeout=600):
+        if socket_path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = socket_path
+        elif port is not None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = ("127.0.0.1", port)
+        else:
+            raise ValueError("QueryClient needs either a socket path or a port")
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._file = self._socket.makefile("rwb")
+        self._next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def request(self, op, **fields):
+        """
+        Sends a request and waits for its response.
+
+        Returns:
+        - The result of the request.
+
+        Raises:
+        - RuntimeError: If the service answered with an error.
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        self._file.write(json.dumps(dict(fields, op=op, id=request_id)).encode() + b"\n")
+        self._file.flush()
+        while True:
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError("the query service closed the connection")
+            response = json.loads(line)
+            if response.get("id") == request_id:
+                break
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def solve(self, R, M_A, M_B):
+        """Returns the result record of a game, see answer()."""
+        return self.request("solve", game=[R, M_A, M_B])
+
+    def batch(self, games):
+        """Returns the result records of a list of (R, M_A, M_B) games, in order."""
+        return self.request("batch", games=[list(game) for game in games])
+
+    def stats(self):
+        """Returns the cache and request statistics of the service."""
+        return self.request("stats")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local query service for solved tie-sharing games, speaking "
+                                                 "JSON lines over a Unix socket or a loopback TCP port.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run the service.")
+    query_parser = subparsers.add_parser("query", help="Query a running service.")
+    for subparser in (serve_parser, query_parser):
+        address = subparser.add_mutually_exclusive_group(required=True)
+        address.add_argument("--socket", help="Path of the Unix socket.")
+        address.add_argument("--port", type=int, help="TCP port on 127.0.0.1.")
+    serve_parser.add_argument("--cache-size", type=int, default=100000, help="Maximum number of cached games.")
+    serve_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    query_parser.add_argument("games", nargs="*", metavar="R,M_A,M_B",
+                              help="Games to query, e.g. 5,3,4. Without games, prints the service statistics.")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.socket, args.port, args.cache_size, args.jobs,
+                              ready=lambda address: print(f"Serving on {address}", flush=True)))
+        except KeyboardInterrupt:
+            pass
+    else:
+        with QueryClient(args.socket, args.port) as client:
+            if not args.games:
+                print(json.dumps(client.stats(), indent=2))
+            else:
+                games = [tuple(int(v) for v in game.split(",")) for game in args.games]
+                for record in client.batch(games):
+                    print(json.dumps(record))
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# modules whose code determines the true signature and equilibria of a game, including the canonical
+# solver and the conversion of solver results in sweep.py
+SOLVER_SOURCES = ["create_game.py", "payoff_matrix.py", "psne.py", "batch_solver.py", "canonical.py", "sweep.py"]
+
+
+def solver_version():
+    """
+    Returns a hash of the game generator and solver source code. Cached
+    results computed with a different version are treated as stale.
+    """
+    digest = hashlib.sha256()
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in SOLVER_SOURCES:
+        with open(os.path.join(src_dir, name), 'rb') as file:
+            digest.update(name.encode() + b'\0' + file.read() + b'\0')
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    On-disk cache of solved games in a local SQLite database.
+
+    Every entry holds the true signature and the pure Nash equilibria of a
+    game (R, M_A, M_B) as computed by a solver version. Entries are written
+    as soon as they are added, so an interrupted sweep resumes from the games
+    it already solved.
+
+    Parameters:
+    - path (str): Path of the SQLite database, created if it does not exist.
+    - version (str, optional): Solver version to read and write entries for,
+      defaults to solver_version().
+    """
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = version or solver_version()
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "R INTEGER, M_A INTEGER, M_B INTEGER, version TEXT, "
+            "signature TEXT, equilibria TEXT, "
+            "PRIMARY KEY (R, M_A, M_B, version))"
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_many(self, games):
+        """
+        Looks up cached solutions.
+
+        Parameters:
+        - games (list): List of (R, M_A, M_B) tuples.
+
+        Returns:
+        - dict: Maps each cached game to its (true_signature, equilibrium_results).
+        """
+        wanted = set(games)
+        solutions = {}
+        rows = self._connection.execute(
+            "SELECT R, M_A, M_B, signature, equilibria FROM results WHERE version = ?", (self.version,))
+        for R, M_A, M_B, signature, equilibria in rows:
+            if (R, M_A, M_B) in wanted:
+                p1_signature, p2_signature = json.loads(signature)
+                solutions[(R, M_A, M_B)] = (
+                    (p1_signature, p2_signature),
+                    [tuple(eq) for eq in json.loads(equilibria)]
+                )
+        return solutions
+
+    def put_many(self, solutions):
+        """
+        Stores solutions and commits them.
+
+        Parameters:
+        - solutions (list): List of ((R, M_A, M_B), (true_signature, equilibrium_results)).
+        """
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            [(R, M_A, M_B, self.version, json.dumps(signature), json.dumps(equilibria))
+             for (R, M_A, M_B), (signature, equilibria) in solutions]
+        )
+        self._connection.commit()
+
+    def prune(self):
+        """Deletes all entries of other solver versions and returns their number."""
+        deleted = self._connection.execute("DELETE FROM results WHERE version != ?", (self.version,)).rowcount
+        self._connection.commit()
+        return deleted
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,230 @@
+import csv
+import heapq
+import os
+import shutil
+import tempfile
+
+RESULTS_HEADER = [
+    "R", "M_A", "M_B",
+    "PredictedSignature", "TrueSignature", "SigPredTrue?", "SigRuleUsed",
+    "PredictedNumPureNash", "TrueNumPureNash", "NumPredTrue?", "NumRuleUsed",
+    "PredNashLoc", "TrueNashLoc", "LocPredTrue?", "LocRuleUsed"
+]
+
+# sorted copies keep the line endings they had when they were written with pandas
+SORTED_LINE_TERMINATOR = "\n"
+
+
+def csv_row(record):
+    """
+    Formats a result record as a row of the results CSV file.
+
+    Parameters:
+    - record (dict): Result record as produced by src.sweep.evaluate_game.
+    """
+    def yes_no(correct):
+        return "Yes" if correct else "No"
+
+    return [
+        record["R"], record["M_A"], record["M_B"],
+        str(record["predicted_signature"]), str(record["true_signature"]),
+        yes_no(record["signature_correct"]), record["signature_rule"],
+        record["predicted_num_nash"], record["true_num_nash"],
+        yes_no(record["num_nash_correct"]), record["nash_rule"],
+        str(record["predicted_nash_locations"]), str(record["true_nash_locations"]),
+        yes_no(record["nash_locations_correct"]), record["nash_rule"]
+    ]
+
+
+def results_sort_key(row):
+    """Sort key of a results CSV row: SigRuleUsed, then R, M_A and M_B as numbers."""
+    return row[6], int(row[0]), int(row[1]), int(row[2])
+
+
+def sort_csv_external(input_csv, output_csv, key=results_sort_key, chunk_rows=100000):
+    """
+    Sorts a CSV file with a header row by an external merge sort.
+
+    At most chunk_rows rows are held in memory: the file is split into
+    sorted runs in a temporary directory, which are then merged.
+
+    Parameters:
+    - input_csv (str): Path of the CSV file to sort.
+    - output_csv (str): Path of the sorted CSV file.
+    - key (callable): Sort key of a row, given as a list of strings.
+    - chunk_rows (int): Number of rows per sorted run.
+    """
+    run_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_csv)))
+    try:
+        run_paths = []
+        with open(input_csv, newline='') as input_file:
+            reader = csv.reader(input_file)
+            header = next(reader)
+            while True:
+                chunk = [row for _, row in zip(range(chunk_rows), reader)]
+                if not chunk:
+                    break
+                chunk.sort(key=key)
+                run_path = os.path.join(run_dir, f"run{len(run_paths)}.csv")
+                with open(run_path, "w", newline='') as run_file:
+                    csv.writer(run_file).writerows(chunk)
+                run_paths.append(run_path)
+
+        run_files = [open(path, newline='') for path in run_paths]
+        try:
+            with open(output_csv, "w", newline='') as output_file:
+                writer = csv.writer(output_file, lineterminator=SORTED_LINE_TERMINATOR)
+                writer.writerow(header)
+                writer.writerows(heapq.merge(*(csv.reader(run_file) for run_file in run_files), key=key))
+        finally:
+            for run_file in run_files:
+                run_file.close()
+    finally:
+        shutil.rmtree(run_dir)
+
+
+def _arrow_schema(pa):
+    signature = pa.list_(pa.int32())
+    locations = pa.list_(pa.list_(pa.int32(), 2))
+    return pa.schema([
+        ("R", pa.int32()), ("M_A", pa.int32()), ("M_B", pa.int32()),
+        ("predicted_signature_p1", signature), ("predicted_signature_p2", signature),
+        ("true_signature_p1", signature), ("true_signature_p2", signature),
+        ("signature_correct", pa.bool_()), ("signature_rule", pa.string()),
+        ("predicted_num_nash", pa.int32()), ("true_num_nash", pa.int32()),
+        ("num_nash_correct", pa.bool_()), ("nash_rule", pa.string()),
+        ("predicted_nash_locations", locations), ("true_nash_locations", locations),
+        ("nash_locations_correct", pa.bool_()),
+    ])
+
+
+class ResultWriter:
+    """
+    Streams result records to the results CSV, an Arrow IPC file and a CSV
+    sorted by rule, without holding the results in memory.
+
+    The sorted CSV is written pre-bucketed: every record is appended to a
+    temporary file of its signature rule, and the buckets are concatenated in
+    rule order on close. Records written in (R, M_A, M_B) order, as the sweep
+    does, leave each bucket already sorted; otherwise the concatenated file
+    is sorted with sort_csv_external.
+
+    Parameters:
+    - csv_path (str, optional): Path of the results CSV file.
+    - arrow_path (str, optional): Path of an Arrow IPC file with typed columns,
+      signatures and equilibrium locations are stored as integer lists.
+      Requires pyarrow.
+    - sorted_csv_path (str, optional): Path of the CSV file sorted by
+      SigRuleUsed, R, M_A and M_B.
+    - batch_size (int): Number of records per Arrow record batch.
+    """
+
+    def __init__(self, csv_path=None, arrow_path=None, sorted_csv_path=None, batch_size=4096):
+        self.csv_path = csv_path
+        self.arrow_path = arrow_path
+        self.sorted_csv_path = sorted_csv_path
+        self.batch_size = batch_size
+
+        self._csv_file = None
+        if csv_path is not None:
+            self._csv_file = open(csv_path, "w", newline='')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(RESULTS_HEADER)
+
+        self._arrow_writer = None
+        if arrow_path is not None:
+            try:
+                import pyarrow as pa
+                import pyarrow.ipc
+            except ImportError:
+                raise ImportError("Writing Arrow results requires pyarrow (pip install pyarrow)") from None
+            self._pa = pa
+            self._schema = _arrow_schema(pa)
+            self._arrow_writer = pa.ipc.new_file(arrow_path, self._schema)
+            self._arrow_batch = []
+
+        self._bucket_dir = None
+        if sorted_csv_path is not None:
+            self._bucket_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(sorted_csv_path)))
+            self._buckets = {}
+            self._bucket_last_key = {}
+            self._buckets_sorted = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record):
+        """Writes one result record, see csv_row for its fields."""
+        if self._csv_file is not None or self._bucket_dir is not None:
+            row = csv_row(record)
+        if self._csv_file is not None:
+            self._csv_writer.writerow(row)
+        if self._arrow_writer is not None:
+            self._arrow_batch.append(record)
+            if len(self._arrow_batch) >= self.batch_size:
+                self._flush_arrow()
+        if self._bucket_dir is not None:
+            self._write_bucket(row)
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def _write_bucket(self, row):
+        rule = row[6]
+        if rule not in self._buckets:
+            bucket_file = open(os.path.join(self._bucket_dir, f"bucket{len(self._buckets)}.csv"), "w", newline='')
+            self._buckets[rule] = (bucket_file, csv.writer(bucket_file, lineterminator=SORTED_LINE_TERMINATOR))
+        key = results_sort_key(row)
+        if rule in self._bucket_last_key and key < self._bucket_last_key[rule]:
+            self._buckets_sorted = False
+        self._bucket_last_key[rule] = key
+        self._buckets[rule][1].writerow(row)
+
+    def _flush_arrow(self):
+        if not self._arrow_batch:
+            return
+        columns = {name: [] for name in self._schema.names}
+        for record in self._arrow_batch:
+            for name in ("R", "M_A", "M_B", "signature_correct", "signature_rule", "predicted_num_nash",
+                         "true_num_nash", "num_nash_correct", "nash_rule", "nash_locations_correct"):
+                columns[name].append(record[name])
+            for prefix in ("predicted", "true"):
+                p1_signature, p2_signature = record[f"{prefix}_signature"]
+                columns[f"{prefix}_signature_p1"].append(list(p1_signature))
+                columns[f"{prefix}_signature_p2"].append(list(p2_signature))
+                columns[f"{prefix}_nash_locations"].append([list(loc) for loc in record[f"{prefix}_nash_locations"]])
+        self._arrow_writer.write_batch(self._pa.record_batch(
+            [self._pa.array(columns[name], type=field.type) for name, field in zip(self._schema.names, self._schema)],
+            schema=self._schema))
+        self._arrow_batch = []
+
+    def _write_sorted(self):
+        for bucket_file, _ in self._buckets.values():
+            bucket_file.close()
+        target = self.sorted_csv_path if self._buckets_sorted else os.path.join(self._bucket_dir, "unsorted.csv")
+        with open(target, "w", newline='') as sorted_file:
+            csv.writer(sorted_file, lineterminator=SORTED_LINE_TERMINATOR).writerow(RESULTS_HEADER)
+            for rule in sorted(self._buckets):
+                with open(self._buckets[rule][0].name, newline='') as bucket_file:
+                    shutil.copyfileobj(bucket_file, sorted_file)
+        if not self._buckets_sorted:
+            sort_csv_external(target, self.sorted_csv_path)
+
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+        if self._arrow_writer is not None:
+            self._flush_arrow()
+            self._arrow_writer.close()
+            self._arrow_writer = None
+        if self._bucket_dir is not None:
+            try:
+                self._write_sorted()
+            finally:
+                shutil.rmtree(self._bucket_dir)
+                self._bucket_dir = None
@@ -0,0 +1,386 @@
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, product
+
+from src.payoff_matrix import PayoffMatrix
+from src.psne import IESDS
+from src.create_game import create_game, scaled_game_payoffs
+from src.game_store import GameStore
+from src.batch_solver import solve_games
+from src.canonical import solve as solve_canonical
+from src.predict_signature import predict_signature
+from src.predict_nash import predict_pure_nash_with_locations
+from src import instrumentation
+
+MODES = ("all", "symmetric", "asymmetric")
+
+
+def filter_mode(games, mode="all"):
+    """
+    Lazily filters (R, M_A, M_B) tuples by game mode.
+
+    Parameters:
+    - games (iterable): (R, M_A, M_B) tuples.
+    - mode (str): "all" keeps every game, "symmetric" only games with M_A == M_B,
+      "asymmetric" only games with M_A != M_B.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    for R, M_A, M_B in games:
+        if mode == "symmetric" and M_A != M_B:
+            continue
+        if mode == "asymmetric" and M_A == M_B:
+            continue
+        yield R, M_A, M_B
+
+
+def product_games(R_values, M_A_values, M_B_values, upper_triangle=True):
+    """
+    Lazily yields all combinations of explicit parameter values, e.g. ranges or lists.
+
+    Parameters:
+    - R_values (iterable): Investment budgets.
+    - M_A_values (iterable): Maximum investments of player A.
+    - M_B_values (iterable): Maximum investments of player B.
+    - upper_triangle (bool): Skip games with M_A > M_B, which mirror games with M_A < M_B.
+    """
+    for R, M_A, M_B in product(R_values, M_A_values, M_B_values):
+        if upper_triangle and M_A > M_B:
+            continue
+        yield R, M_A, M_B
+
+
+def random_games(n, R_values, M_A_values, M_B_values, seed=None):
+    """
+    Yields n games with parameters drawn uniformly and independently from the given values.
+
+    Parameters:
+    - n (int): Number of games, None for an endless stream.
+    - R_values (sequence): Investment budgets to draw from, e.g. range(1, 100).
+    - M_A_values (sequence): Maximum investments of player A to draw from.
+    - M_B_values (sequence): Maximum investments of player B to draw from.
+    - seed (int, optional): Seed of the random generator, for reproducible samples.
+    """
+    rng = random.Random(seed)
+    drawn = 0
+    while n is None or drawn < n:
+        yield rng.choice(R_values), rng.choice(M_A_values), rng.choice(M_B_values)
+        drawn += 1
+
+
+def game_grid(mode="all", max_players=10, max_M_A=10, max_M_B=10):
+    """
+    Yields the (R, M_A, M_B) parameters of the default sweep in a fixed order.
+
+    Parameters:
+    - mode (str): Game mode, either "all", "symmetric", or "asymmetric".
+    - max_players (int): Exclusive upper bound for R.
+    - max_M_A (int): Exclusive upper bound for M_A.
+    - max_M_B (int): Exclusive upper bound for M_B, with M_A <= M_B.
+    """
+    return filter_mode(product_games(range(1, max_players), range(1, max_M_A), range(1, max_M_B)), mode)
+
+
+def load_or_create_game(R, M_A, M_B, games_dir=None, game_store=None):
+    """
+    Returns the game for the given parameters as a PayoffMatrix.
+
+    Games are generated in memory. If a game store or games_dir is given, a
+    previously saved game is loaded from it and newly generated games are
+    saved to it.
+
+    Parameters:
+    - R (int): Investment budget of the game.
+    - M_A (int): Maximum investment for player A.
+    - M_B (int): Maximum investment for player B.
+    - games_dir (str, optional): Directory holding one CSV file per game.
+    - game_store (GameStore, optional): Open binary game store, takes precedence over games_dir.
+    """
+    if game_store is not None:
+        key = (R, M_A, M_B)
+        with instrumentation.stage("game.store"):
+            if key not in game_store:
+                game_store.add(key, *scaled_game_payoffs(R, M_A, M_B))
+            return game_store.open_game(key)
+
+    if games_dir is None:
+        with instrumentation.stage("game.create"):
+            return create_game(R, M_A, M_B)
+
+    game_path = os.path.join(games_dir, f"{R}_{M_A}_{M_B}.csv")
+    if os.path.exists(game_path):
+        with instrumentation.stage("game.load_csv"):
+            return PayoffMatrix(file_source=game_path)
+    with instrumentation.stage("game.create"):
+        return create_game(R, M_A, M_B, SAVE_PATH=game_path)
+
+
+def solve_game(game_instance):
+    """
+    Runs IESDS and the best response search on a game.
+
+    Parameters:
+    - game_instance (PayoffMatrix): The game, reduced in place by IESDS.
+
+    Returns:
+    - tuple: The true signature as a tuple of sorted strategy lists and the list of pure Nash equilibria.
+    """
+    equilibrium_results, _ = IESDS(game_instance, show_steps=False, batched=True)
+    equilibrium_results = [(int(eq[0]), int(eq[1])) for eq in equilibrium_results]
+    true_signature = (
+        sorted([int(s) for s in game_instance.p1_strategies]),
+        sorted([int(s) for s in game_instance.p2_strategies])
+    )
+    return true_signature, equilibrium_results
+
+
+def solve_games_batched(games):
+    """
+    Solves a list of games at once with the batched tensor solver.
+
+    Parameters:
+    - games (list): List of PayoffMatrix objects.
+
+    Returns:
+    - list: The (true_signature, equilibrium_results) of each game, as returned by solve_game.
+    """
+    return [
+        ((sorted(int(s) for s in p1_strategies), sorted(int(s) for s in p2_strategies)),
+         [(int(eq[0]), int(eq[1])) for eq in equilibria])
+        for p1_strategies, p2_strategies, equilibria in solve_games(games)
+    ]
+
+
+def evaluate_game(R, M_A, M_B, true_signature, equilibrium_results):
+    """
+    Compares the true signature and pure Nash equilibria of a solved game with the predictions.
+
+    Parameters:
+    - R (int): Investment budget of the game.
+    - M_A (int): Maximum investment for player A.
+    - M_B (int): Maximum investment for player B.
+    - true_signature (tuple): Sorted surviving strategies of both players after IESDS.
+    - equilibrium_results (list): Pure Nash equilibria of the game.
+
+    Returns:
+    - dict: The result record, with typed fields as written to the results files by
+      src.results_writer.ResultWriter.
+    """
+    # Predict signature and rule
+    predicted_p1, predicted_p2, sig_rule_used = predict_signature(R, M_A, M_B)
+    predicted_signature = (sorted(predicted_p1 or []), sorted(predicted_p2 or []))
+
+    num_nash_equilibria = len(equilibrium_results)
+
+    # Predict the number and locations of pure Nash equilibria
+    predicted_nash_count, predicted_nash_locs, nash_rule_used = predict_pure_nash_with_locations(R, M_A, M_B)
+
+    # Determine prediction correctness, locations are compared as they are written to the CSV file
+    return {
+        "R": R, "M_A": M_A, "M_B": M_B,
+        "predicted_signature": predicted_signature, "true_signature": true_signature,
+        "signature_correct": predicted_signature == true_signature, "signature_rule": sig_rule_used,
+        "predicted_num_nash": predicted_nash_count, "true_num_nash": num_nash_equilibria,
+        "num_nash_correct": predicted_nash_count == num_nash_equilibria, "nash_rule": nash_rule_used,
+        "predicted_nash_locations": predicted_nash_locs, "true_nash_locations": equilibrium_results,
+        "nash_locations_correct": str(predicted_nash_locs) == str(equilibrium_results)
+    }
+
+
+def evaluate_games(games, games_dir=None, game_store_path=None, solver="iesds", cached_solutions=None):
+    """
+    Solves and evaluates a chunk of games, e.g. inside a worker process.
+
+    Parameters:
+    - games (list): List of (R, M_A, M_B) tuples.
+    - games_dir (str, optional): Directory holding one CSV file per game.
+    - game_store_path (str, optional): Game store holding all games of the chunk, opened read-only.
+    - solver (str): "iesds" to solve each game with psne.IESDS, "batch" to solve the
+      whole chunk at once with the batched tensor solver, "canonical" to solve only the
+      canonical game of each game, memoized per process.
+    - cached_solutions (dict, optional): Maps already solved games to their
+      (true_signature, equilibrium_results), these games are only scored.
+
+    Returns:
+    - list: The result records of the chunk, in the order of games.
+    """
+    cached_solutions = cached_solutions or {}
+    unsolved = [game for game in games if game not in cached_solutions]
+    game_store = GameStore(game_store_path) if game_store_path is not None and unsolved and solver != "canonical" else None
+    persist = games_dir is not None or game_store is not None
+
+    # For a fixed R, every game (R, M_A, M_B) is the top-left corner of the largest game with that R,
+    # so unless games are persisted, one payoff tensor per R is built and the games are views into it
+    largest_game = {}
+    for R, M_A, M_B in unsolved:
+        max_A, max_B = largest_game.get(R, (0, 0))
+        largest_game[R] = (max(max_A, M_A), max(max_B, M_B))
+
+    def game_instances():
+        superset_R, superset = None, None
+        for R, M_A, M_B in unsolved:
+            if persist:
+                yield load_or_create_game(R, M_A, M_B, games_dir, game_store)
+            else:
+                if R != superset_R:
+                    with instrumentation.stage("game.create"):
+                        superset_R, superset = R, create_game(R, *largest_game[R])
+                yield PayoffMatrix(payoffs=superset.payoffs[:M_A + 1, :M_B + 1], copy_payoffs=False,
+                                   scale=superset.scale)
+
+    instrumentation.count("games", len(games))
+    instrumentation.count("games_cached", len(games) - len(unsolved))
+    if solver == "batch":
+        game_list = list(game_instances())
+        with instrumentation.stage("solve"):
+            new_solutions = solve_games_batched(game_list)
+    elif solver == "canonical":
+        new_solutions = []
+        for game in unsolved:
+            with instrumentation.game(game), instrumentation.stage("solve"):
+                new_solutions.append(solve_canonical(*game))
+    else:
+        new_solutions = []
+        for game, game_instance in zip(unsolved, game_instances()):
+            with instrumentation.game(game), instrumentation.stage("solve"):
+                new_solutions.append(solve_game(game_instance))
+    if game_store is not None:
+        game_store.close()
+    solutions = dict(cached_solutions)
+    solutions.update(zip(unsolved, new_solutions))
+
+    with instrumentation.stage("predict"):
+        return [evaluate_game(R, M_A, M_B, *solutions[(R, M_A, M_B)]) for R, M_A, M_B in games]
+
+
+def _evaluate_games_star(args):
+    # the last argument tells a worker process to collect instrumentation, which is returned with the records
+    *args, per_game = args
+    if per_game is None:
+        return evaluate_games(*args), None
+    with instrumentation.collect(per_game) as collected:
+        records = evaluate_games(*args)
+    return records, collected.to_dict()
+
+
+def sweep(games, mode="all", solver="iesds", chunk_size=64, jobs=1,
+          games_dir=None, game_store_path=None, cached_solutions=None):
+    """
+    Lazily solves and evaluates games, yielding one result record per game in input order.
+
+    Games are taken from the iterator chunk by chunk, so only a bounded number
+    of chunks is held in memory however long the iterator is, and a consumer
+    can stop the sweep at any time by no longer iterating.
+
+    Parameters:
+    - games (iterable): (R, M_A, M_B) tuples, e.g. from game_grid, product_games or random_games.
+    - mode (str): Only evaluate "all", "symmetric" or "asymmetric" games.
+    - solver (str): "iesds", "batch" or "canonical", see evaluate_games.
+    - chunk_size (int): Number of games solved per chunk.
+    - jobs (int): Number of worker processes, 0 uses all cores. At most 2 * jobs chunks are in flight.
+    - games_dir (str, optional): Directory holding one CSV file per game.
+    - game_store_path (str, optional): Game store holding all games, opened read-only.
+    - cached_solutions (dict, optional): Maps already solved games to their
+      (true_signature, equilibrium_results), these games are only scored.
+
+    If instrumentation is enabled, the stages and counters of all chunks,
+    including those solved by worker processes, are added to it.
+
+    Yields:
+    - dict: Result records as returned by evaluate_game.
+    """
+    cached_solutions = cached_solutions or {}
+    games = filter_mode(games, mode)
+    collecting = instrumentation.active()
+
+    def chunks():
+        while True:
+            chunk = list(islice(games, chunk_size))
+            if not chunk:
+                return
+            chunk_cached = {game: cached_solutions[game] for game in chunk if game in cached_solutions}
+            yield chunk, games_dir, game_store_path, solver, chunk_cached
+
+    jobs = jobs or os.cpu_count()
+    if jobs == 1:
+        for chunk_args in chunks():
+            yield from evaluate_games(*chunk_args)
+        return
+
+    def chunk_records(future):
+        records, collected = future.result()
+        if collected is not None:
+            collecting.merge(collected)
+        return records
+
+    per_game = None if collecting is None else collecting.per_game
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    pending = deque()
+    try:
+        for chunk_args in chunks():
+            pending.append(executor.submit(_evaluate_games_star, chunk_args + (per_game,)))
+            if len(pending) >= 2 * jobs:
+                yield from chunk_records(pending.popleft())
+        while pending:
+            yield from chunk_records(pending.popleft())
+    finally:
+        # a consumer that stops early leaves chunks in flight, those that did not start yet are dropped
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+class AccuracyTally:
+    """
+    Sink that counts correct and incorrect predictions per rule.
+
+    rule_performance maps "signature", "nash_count" and "nash_location" to
+    dictionaries of {rule: {"correct": n, "incorrect": n}}, with rules in
+    order of first appearance.
+    """
+
+    OUTCOMES = (
+        ("signature", "signature_rule", "signature_correct"),
+        ("nash_count", "nash_rule", "num_nash_correct"),
+        ("nash_location", "nash_rule", "nash_locations_correct"),
+    )
+
+    def __init__(self):
+        self.rule_performance = {tracker: {} for tracker, _, _ in self.OUTCOMES}
+
+    def __call__(self, record):
+        for tracker, rule_field, correct_field in self.OUTCOMES:
+            counts = self.rule_performance[tracker].setdefault(record[rule_field], {"correct": 0, "incorrect": 0})
+            counts["correct" if record[correct_field] else "incorrect"] += 1
+
+
+def is_mispredicted(record):
+    """Returns whether any prediction of a result record is wrong."""
+    return not (record["signature_correct"] and record["num_nash_correct"] and record["nash_locations_correct"])
+
+
+def until_first_mismatch(records, is_mismatch=is_mispredicted):
+    """
+    Yields records up to and including the first mispredicted one, then stops the sweep.
+    """
+    for record in records:
+        yield record
+        if is_mismatch(record):
+            return
+
+
+def consume(records, *sinks):
+    """
+    Passes every record to all sinks, e.g. an AccuracyTally or ResultWriter.write.
+
+    Returns:
+    - int: The number of records consumed.
+    """
+    count = 0
+    for record in records:
+        for sink in sinks:
+            sink(record)
+        count += 1
+    return count